@@ -0,0 +1,192 @@
+"""
+Admission control in front of the chat completion path.
+A chat turn is admitted only if both the global and its conversation's token bucket have a
+token and fewer than a fixed number of turns are being generated. Otherwise it is rejected at
+once with the time after which a retry can succeed, instead of waiting in an unbounded queue.
+Turns on the same conversation run one at a time, so each sees the history of the previous one.
+"""
+
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Raised when a chat turn is over capacity."""
+
+    def __init__(self, reason, retry_after):
+        """
+        Args:
+            reason (str): `conversation_rate`, `global_rate`, `in_flight` or `conversation_busy`
+            retry_after (float): Seconds after which a retry may be admitted
+        """
+        super().__init__(f"Too many requests ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate, burst, now=None):
+        """
+        Args:
+            rate (float): Tokens added per second
+            burst (float): Maximum number of tokens, the bucket starts full
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now if now is not None else time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        Returns:
+            float: Seconds until a token is available, 0 if one is available now
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+class _Turns:
+    """Serializes the turns of one conversation"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+class AdmissionController:
+    def __init__(self, global_rate, global_burst, conversation_rate, conversation_burst,
+                 max_in_flight, max_waiting_per_conversation=1, max_conversations=10000):
+        """
+        Args:
+            global_rate (float): Turns per second admitted overall, 0 for no limit
+            global_burst (float): Turns admitted at once after an idle period
+            conversation_rate (float): Turns per second admitted per conversation, 0 for no limit
+            conversation_burst (float): Turns admitted at once per conversation
+            max_in_flight (int): Turns generated at the same time, 0 for no limit
+            max_waiting_per_conversation (int): Turns waiting for the previous turn of their
+                conversation to finish, further ones are rejected
+            max_conversations (int): Conversation buckets kept, the least recently used are
+                dropped first
+        """
+        self.conversation_rate = conversation_rate
+        self.conversation_burst = conversation_burst
+        self.max_in_flight = max_in_flight
+        self.max_waiting_per_conversation = max_waiting_per_conversation
+        self.max_conversations = max_conversations
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        # conversation id -> TokenBucket, least recently used first
+        self._buckets = OrderedDict()
+        # conversation id -> _Turns, only while a turn holds or waits for it
+        self._turns = {}
+        self.in_flight = 0
+        self.stats = {
+            "admitted": 0,
+            "conversation_rate": 0,
+            "global_rate": 0,
+            "in_flight": 0,
+            "conversation_busy": 0,
+        }
+
+    def _conversation_bucket(self, conversation_id, now):
+        bucket = self._buckets.get(conversation_id)
+        if bucket is None:
+            bucket = TokenBucket(self.conversation_rate, self.conversation_burst, now)
+            self._buckets[conversation_id] = bucket
+            while len(self._buckets) > self.max_conversations:
+                # A dropped bucket starts full again, only idle conversations lose anything
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(conversation_id)
+        return bucket
+
+    def _reject(self, reason, retry_after):
+        self.stats[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def _check_rates(self, conversation_id):
+        # Both buckets are checked before either is charged, so a rejected turn costs nothing
+        now = time.monotonic()
+        buckets = []
+        if self.conversation_rate > 0:
+            bucket = self._conversation_bucket(conversation_id, now)
+            wait = bucket.wait_time(now)
+            if wait:
+                self._reject("conversation_rate", wait)
+            buckets.append(bucket)
+        if self.global_bucket is not None:
+            wait = self.global_bucket.wait_time(now)
+            if wait:
+                self._reject("global_rate", wait)
+            buckets.append(self.global_bucket)
+        for bucket in buckets:
+            bucket.take(now)
+
+    @asynccontextmanager
+    async def admit(self, conversation_id):
+        """
+        Hold an admitted turn of a conversation for the duration of the block, after the
+        previous turn of the conversation has finished.
+
+        Raises:
+            AdmissionRejected: If the turn is over a rate limit, too many turns are in flight,
+                or too many turns of the conversation are already waiting
+        """
+        turns = self._turns.get(conversation_id)
+        # One turn runs, the others wait for it
+        if turns is not None and turns.holders > self.max_waiting_per_conversation:
+            self._reject("conversation_busy", 1.0)
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self._reject("in_flight", 1.0)
+        self._check_rates(conversation_id)
+
+        if turns is None:
+            turns = self._turns[conversation_id] = _Turns()
+        turns.holders += 1
+        try:
+            async with turns.lock:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                try:
+                    yield
+                finally:
+                    self.in_flight -= 1
+        finally:
+            turns.holders -= 1
+            if not turns.holders:
+                del self._turns[conversation_id]
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Admitted turns, rejections per reason, and the turns in flight
+        """
+        return {
+            **self.stats,
+            "in_flight_now": self.in_flight,
+            "conversations_busy": len(self._turns),
+            "max_in_flight": self.max_in_flight,
+        }
+
+# Create a singleton instance for chat turns. The default in-flight cap matches the upstream
+# completion slots plus their wait queue, turns beyond it would only get an error response
+chat_admission = AdmissionController(
+    global_rate=float(os.getenv("ADMISSION_GLOBAL_RATE", "20")),
+    global_burst=float(os.getenv("ADMISSION_GLOBAL_BURST", "40")),
+    conversation_rate=float(os.getenv("ADMISSION_CONVERSATION_RATE", "0.5")),
+    conversation_burst=float(os.getenv("ADMISSION_CONVERSATION_BURST", "3")),
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "80")),
+    max_waiting_per_conversation=int(os.getenv("ADMISSION_MAX_WAITING_PER_CONVERSATION", "1")),
+)
@@ -1,4 +1,3 @@
-import openai
 import asyncio
 import json
 from typing import List, Dict, Any
@@ -19,6 +18,44 @@ try:
 except ImportError:
     from app.guardrails import guardrails
 
+# Import the local output screening stage
+try:
+    from .output_rails import output_screen, BLOCK, ESCALATE
+except ImportError:
+    from app.output_rails import output_screen, BLOCK, ESCALATE
+
+# Import the answer cache
+try:
+    from .response_cache import response_cache
+except ImportError:
+    from app.response_cache import response_cache
+
+# Import per-stage metrics
+try:
+    from .metrics import (
+        registry, CONTENT_FILTER_SECONDS, OUTPUT_SCREEN_SECONDS, GUARDRAILS_SECONDS,
+        LLM_SECONDS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS
+    )
+    from .context_window import estimate_tokens
+except ImportError:
+    from app.metrics import (
+        registry, CONTENT_FILTER_SECONDS, OUTPUT_SCREEN_SECONDS, GUARDRAILS_SECONDS,
+        LLM_SECONDS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS
+    )
+    from app.context_window import estimate_tokens
+
+# Import bounded concurrency for upstream calls
+try:
+    from .concurrency import ConcurrencyLimiter
+except ImportError:
+    from app.concurrency import ConcurrencyLimiter
+
+# Import the pool of completion endpoints
+try:
+    from .llm_pool import Endpoint, ProviderPool, load_endpoint_specs
+except ImportError:
+    from app.llm_pool import Endpoint, ProviderPool, load_endpoint_specs
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -26,94 +63,122 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = "You are a helpful assistant specializing in medical topics. Do not include jokes or humor in your responses. Never provide jokes even if explicitly asked."
+
+# Returned instead of an improved response when generation fails
+IMPROVEMENT_FALLBACK = "I'm sorry, I'm having trouble processing your feedback request. Please try again later."
+
 class AIModel:
     def __init__(self):
-        # Initialize OpenAI client
-        self.api_key = os.getenv("OPENAI_API_KEY", "your-api-key")
-        self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        # Bound the number of concurrent upstream completions
+        self.limiter = ConcurrencyLimiter(
+            "llm",
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "16")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+        )
         
-        # For older OpenAI version compatibility
-        try:
-            self.client = openai.OpenAI(api_key=self.api_key)
-            self.is_new_client = True
-        except (AttributeError, TypeError):
-            # Fallback for older OpenAI package
-            openai.api_key = self.api_key
-            self.is_new_client = False
-            logger.info("Using legacy OpenAI client")
+        # One connection pool per OpenAI-compatible endpoint, e.g. NVIDIA's API or a local stub for benchmarks
+        self.pool = ProviderPool(
+            [Endpoint(timeout=self.limiter.timeout, **spec) for spec in load_endpoint_specs()],
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0")),
+            hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")),
+            eject_after=int(os.getenv("LLM_EJECT_AFTER", "3")),
+            eject_seconds=float(os.getenv("LLM_EJECT_SECONDS", "30")),
+        )
+        self.model = self.pool.endpoints[0].model
+        if not self.pool.endpoints[0].is_new_client:
+            logger.info("Using legacy OpenAI client with a session per endpoint")
         
-        # Check if guardrails are available
-        self.use_guardrails = guardrails is not None
-        if self.use_guardrails:
-            logger.info("NeMo Guardrails initialized and will be used for responses")
-        else:
-            logger.warning("NeMo Guardrails not available, fallback to basic filtering")
+        # Guardrails load in the background once the app starts, see use_guardrails
+        if not guardrails.enabled:
+            logger.warning("NeMo Guardrails disabled, fallback to basic filtering")
         
-        logger.info(f"AI Model initialized with model: {self.model}")
+        logger.info(f"AI Model initialized with model: {self.model} on {len(self.pool.endpoints)} endpoint(s)")
 
-    async def generate_response(self, messages):
-        """Generate a response using the NVIDIA AI model via OpenAI API"""
-        try:
-            # Extract just the content from messages for context
-            message_texts = []
-            last_message_content = ""
-            
-            for msg in messages:
-                if isinstance(msg, Dict):
-                    sender = msg.get("sender", "unknown")
-                    content = msg.get("content", "")
-                else:
-                    sender = getattr(msg, "sender", "unknown")
-                    content = getattr(msg, "content", "")
-                
-                message_texts.append(f"{sender.capitalize()}: {content}")
-                
-                # Keep track of the last user message for content filtering
-                if sender == "user":
-                    last_message_content = content
-            
-            context = "\n".join(message_texts)
+    @property
+    def use_guardrails(self):
+        """Guardrails are only used once loaded, until then the local content filter path is used"""
+        return guardrails.is_ready
+
+    async def _complete(self, prompt, max_tokens):
+        """Run a chat completion through the concurrency limiter on the endpoint pool"""
+        completion_messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        
+        async def call():
+            with LLM_SECONDS.time(kind="complete"):
+                content, usage = await self.pool.complete(completion_messages, max_tokens)
             
-            # Apply content filter to user input
-            if last_message_content:
-                is_blocked, filter_response = content_filter.filter_message(last_message_content)
-                if is_blocked:
-                    logger.info("Content filter blocked a request for joke content")
-                    return filter_response
+            # Fall back to estimates for backends that don't report usage
+            prompt_tokens, completion_tokens = usage or (estimate_tokens(SYSTEM_PROMPT + prompt), estimate_tokens(content))
+            LLM_PROMPT_TOKENS.observe(prompt_tokens)
+            LLM_COMPLETION_TOKENS.observe(completion_tokens)
+            return content
+        
+        return await self.limiter.run(call)
+
+    async def _stream(self, prompt, max_tokens):
+        """Stream a chat completion token by token while holding a limiter slot"""
+        completion_messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        loop = asyncio.get_running_loop()
+        
+        async with self.limiter.slot():
+            # The per-call timeout covers the whole stream, not each chunk
+            started = loop.time()
+            deadline = started + self.limiter.timeout
+            streamed_tokens = 0
+            chunks = self.pool.stream(completion_messages, max_tokens)
+            try:
+                while True:
+                    try:
+                        token = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        break
+                    streamed_tokens += 1
+                    yield token
+            finally:
+                await chunks.aclose()
             
-            # Process with NeMo Guardrails if available
-            if self.use_guardrails and last_message_content:
-                try:
-                    # Format messages for guardrails
-                    guardrail_messages = []
-                    for msg in messages:
-                        if isinstance(msg, Dict):
-                            sender = msg.get("sender", "unknown")
-                            content = msg.get("content", "")
-                        else:
-                            sender = getattr(msg, "sender", "unknown")
-                            content = getattr(msg, "content", "")
-                        
-                        if sender == "user":
-                            guardrail_messages.append({"role": "user", "content": content})
-                        else:
-                            guardrail_messages.append({"role": "assistant", "content": content})
-                    
-                    # Get response through guardrails
-                    guardrail_response = guardrails.generate_response(
-                        messages=guardrail_messages,
-                    )
-                    
-                    if guardrail_response:
-                        logger.info("Response generated through NeMo Guardrails")
-                        return guardrail_response["content"]
-                    
-                except Exception as e:
-                    logger.error(f"Error using NeMo Guardrails: {str(e)}")
-                    logger.info("Falling back to direct API call")
+            # Streamed chunks are roughly one token each
+            LLM_SECONDS.observe(loop.time() - started, kind="stream")
+            LLM_PROMPT_TOKENS.observe(estimate_tokens(SYSTEM_PROMPT + prompt))
+            LLM_COMPLETION_TOKENS.observe(streamed_tokens)
+
+    def _read_message(self, msg):
+        """Return (sender, content) for a message stored as a dict or a model instance"""
+        if isinstance(msg, Dict):
+            return msg.get("sender", "unknown"), msg.get("content", "")
+        return getattr(msg, "sender", "unknown"), getattr(msg, "content", "")
+
+    def _build_context(self, messages, summary=None):
+        """Join messages into a transcript, prefixed by the rolling summary, and find the last user message"""
+        message_texts = []
+        last_message_content = ""
+        
+        for msg in messages:
+            sender, content = self._read_message(msg)
+            message_texts.append(f"{sender.capitalize()}: {content}")
             
-            # Create the prompt for the model
-            prompt = f"""You are a helpful assistant specialized in medical topics.
+            # Keep track of the last user message for content filtering
+            if sender == "user":
+                last_message_content = content
+        
+        context = "\n".join(message_texts)
+        if summary:
+            context = f"Summary of earlier messages:\n{summary}\n\nMost recent messages:\n{context}"
+        
+        return context, last_message_content
+
+    def _response_prompt(self, context):
+        """Create the prompt for answering the last message of a conversation"""
+        return f"""You are a helpful assistant specialized in medical topics.
             
 Previous conversation:
 {context}
@@ -121,47 +186,188 @@ Previous conversation:
 Please provide a helpful, accurate, and friendly response to the last message. 
 Respond directly without referring to yourself as an AI or mentioning that you're here to help.
 Remember to avoid humor, jokes, or any non-medical content. Even if the user explicitly asks for a joke, you must refuse."""
-            
-            # Call OpenAI API
-            if self.is_new_client:
-                # New client version
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "system", "content": "You are a helpful assistant specializing in medical topics. Do not include jokes or humor in your responses. Never provide jokes even if explicitly asked."}, 
-                              {"role": "user", "content": prompt}],
-                    max_tokens=500
-                )
-                return response.choices[0].message.content.strip()
+
+    def _apply_content_filter(self, last_message_content):
+        """Return the canned response if the local content filter blocks the message, else None"""
+        if last_message_content:
+            with CONTENT_FILTER_SECONDS.time():
+                is_blocked, filter_response = content_filter.filter_message(last_message_content)
+            if is_blocked:
+                logger.info("Content filter blocked a request for joke content")
+                return filter_response
+        return None
+
+    def _guardrail_messages(self, messages):
+        """Format messages for guardrails"""
+        guardrail_messages = []
+        for msg in messages:
+            sender, content = self._read_message(msg)
+            if sender == "user":
+                guardrail_messages.append({"role": "user", "content": content})
             else:
-                # Old client version
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[{"role": "system", "content": "You are a helpful assistant specializing in medical topics. Do not include jokes or humor in your responses. Never provide jokes even if explicitly asked."}, 
-                              {"role": "user", "content": prompt}],
-                    max_tokens=500
+                guardrail_messages.append({"role": "assistant", "content": content})
+        return guardrail_messages
+
+    async def _generate_with_guardrails(self, messages):
+        """Generate a response through NeMo Guardrails, returning None if unavailable or failing"""
+        try:
+            # Get response through the input and dialog rails, counted against the upstream
+            # concurrency limit. Output rails run separately in _screen_output.
+            with GUARDRAILS_SECONDS.time(stage="generate"):
+                guardrail_response = await self.limiter.run(
+                    lambda: guardrails.generate_response(
+                        messages=self._guardrail_messages(messages),
+                        rails=["input", "dialog"]
+                    ),
+                    timeout=guardrails.timeout
+                )
+            
+            if guardrail_response:
+                logger.info("Response generated through NeMo Guardrails")
+                return guardrail_response["content"]
+            
+        except Exception as e:
+            logger.error(f"Error using NeMo Guardrails: {str(e) or type(e).__name__}")
+            logger.info("Falling back to direct API call")
+        return None
+
+    async def _screen_output(self, messages, response):
+        """
+        Screen a bot response with the local output stage, escalating to the
+        LLM-backed output rails unless it was blocked or is a canned reply
+
+        Returns:
+            tuple: (response, blocked) where blocked is True if the local stage or the
+                   output rails replaced the response
+        """
+        with OUTPUT_SCREEN_SECONDS.time():
+            decision, response = output_screen.evaluate(response)
+        if decision != ESCALATE or not self.use_guardrails:
+            return response, decision == BLOCK
+        
+        try:
+            with GUARDRAILS_SECONDS.time(stage="output"):
+                checked_response = await self.limiter.run(
+                    lambda: guardrails.check_output(self._guardrail_messages(messages), response),
+                    timeout=guardrails.timeout
                 )
-                return response['choices'][0]['message']['content'].strip()
+            if checked_response and checked_response != response:
+                return checked_response, True
+            return response, False
+        except Exception as e:
+            logger.error(f"Error running NeMo Guardrails output rails: {str(e) or type(e).__name__}")
+            return response, False
+
+    async def generate_response(self, messages, summary=None):
+        """
+        Generate a response using the NVIDIA AI model via OpenAI API.
+        `messages` is the recent context window and `summary` the rolling summary of older turns.
+
+        Returns:
+            tuple: (response, blocked) where blocked is True if the content filter or output
+                   screening gave the response instead of an answer
+        """
+        try:
+            # Extract just the content from messages for context
+            context, last_message_content = self._build_context(messages, summary)
+            
+            # Apply content filter to user input
+            filter_response = self._apply_content_filter(last_message_content)
+            if filter_response:
+                return filter_response, True
+            
+            # Answer recurring questions from the cache
+            cache_key, question = response_cache.make_key(messages, summary)
+            cached_response = await response_cache.get(cache_key)
+            if cached_response:
+                return cached_response, False
+            
+            # Process with NeMo Guardrails if available
+            response = None
+            if self.use_guardrails and last_message_content:
+                response = await self._generate_with_guardrails(messages)
+            
+            # Call OpenAI API without blocking the event loop
+            if not response:
+                response = await self._complete(self._response_prompt(context), max_tokens=500)
+            
+            response, blocked = await self._screen_output(messages, response)
+            # Blocked replies aren't cached, so every block is counted as one
+            if not blocked:
+                await response_cache.set(cache_key, question, response)
+            return response, blocked
                 
         except Exception as e:
             logger.error(f"Error generating AI response: {str(e)}")
-            return "I'm sorry, I'm having trouble processing your request. Please try again later."
+            return "I'm sorry, I'm having trouble processing your request. Please try again later.", False
 
-    async def generate_improved_response(self, messages, original_response, feedback):
+    async def stream_response(self, messages, summary=None):
+        """
+        Generate a response like generate_response, yielding ("token", text) chunks as soon
+        as the model produces them. Filtered, cached and guardrails responses are yielded whole.
+        If output screening changes a streamed response, a final ("replace", text) carries
+        the text that should be kept instead of the streamed tokens. A last ("blocked", None)
+        follows when the content filter or output screening gave the response.
+        """
+        produced = False
+        try:
+            context, last_message_content = self._build_context(messages, summary)
+            
+            # Apply content filter before any upstream call
+            filter_response = self._apply_content_filter(last_message_content)
+            if filter_response:
+                yield "token", filter_response
+                yield "blocked", None
+                return
+            
+            # Cached answers are sent as a single chunk
+            cache_key, question = response_cache.make_key(messages, summary)
+            cached_response = await response_cache.get(cache_key)
+            if cached_response:
+                yield "token", cached_response
+                return
+            
+            # Guardrails do not stream, so their answer is screened and sent as a single chunk
+            if self.use_guardrails and last_message_content:
+                guardrail_response = await self._generate_with_guardrails(messages)
+                if guardrail_response:
+                    guardrail_response, blocked = await self._screen_output(messages, guardrail_response)
+                    yield "token", guardrail_response
+                    if blocked:
+                        yield "blocked", None
+                    else:
+                        await response_cache.set(cache_key, question, guardrail_response)
+                    return
+            
+            tokens = []
+            async for token in self._stream(self._response_prompt(context), max_tokens=500):
+                produced = True
+                tokens.append(token)
+                yield "token", token
+            
+            # Output can only be screened once complete
+            response = "".join(tokens).strip()
+            screened_response, blocked = await self._screen_output(messages, response)
+            if screened_response != response:
+                yield "replace", screened_response
+            
+            # Only complete streams that weren't blocked are cached
+            if blocked:
+                yield "blocked", None
+            else:
+                await response_cache.set(cache_key, question, screened_response)
+                
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {str(e)}")
+            # Only replace the answer if nothing reached the client yet
+            if not produced:
+                yield "token", "I'm sorry, I'm having trouble processing your request. Please try again later."
+
+    async def generate_improved_response(self, messages, original_response, feedback, summary=None):
         """Generate an improved response based on user feedback"""
         try:
             # Extract just the content from messages for context
-            message_texts = []
-            for msg in messages:
-                if isinstance(msg, Dict):
-                    sender = msg.get("sender", "unknown")
-                    content = msg.get("content", "")
-                else:
-                    sender = getattr(msg, "sender", "unknown")
-                    content = getattr(msg, "content", "")
-                
-                message_texts.append(f"{sender.capitalize()}: {content}")
-            
-            context = "\n".join(message_texts)
+            context, _ = self._build_context(messages, summary)
             
             # Create the prompt for the model
             prompt = f"""You are a helpful assistant specialized in medical topics.
@@ -180,33 +386,27 @@ The improved response should be more accurate, helpful, and address the specific
 Respond directly without referring to yourself as an AI or mentioning that you're here to help.
 Remember to avoid humor, jokes, or any non-medical content. Even if the user explicitly asks for a joke, you must refuse."""
             
-            # Call OpenAI API
-            if self.is_new_client:
-                # New client version
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant specializing in medical topics. Do not include jokes or humor in your responses. Never provide jokes even if explicitly asked."}, 
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=700
-                )
-                return response.choices[0].message.content.strip()
-            else:
-                # Old client version
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant specializing in medical topics. Do not include jokes or humor in your responses. Never provide jokes even if explicitly asked."}, 
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=700
-                )
-                return response['choices'][0]['message']['content'].strip()
+            # Call OpenAI API without blocking the event loop
+            return await self._complete(prompt, max_tokens=700)
                 
         except Exception as e:
             logger.error(f"Error generating improved AI response: {str(e)}")
-            return "I'm sorry, I'm having trouble processing your feedback request. Please try again later."
+            return IMPROVEMENT_FALLBACK
 
 # Create a singleton instance
-ai_model = AIModel() 
\ No newline at end of file
+ai_model = AIModel()
+
+# Upstream concurrency, read at scrape time
+registry.gauge("chat_llm_in_flight", "Upstream completions in flight", callback=lambda: ai_model.limiter.in_flight)
+registry.gauge("chat_llm_queue_depth", "Upstream completions waiting for a slot", callback=lambda: ai_model.limiter.waiting)
+registry.gauge(
+    "chat_llm_endpoint_outstanding", "Completions outstanding per upstream endpoint", ("endpoint",),
+    callback=lambda: {(endpoint.name,): endpoint.outstanding for endpoint in ai_model.pool.endpoints}
+)
+registry.counter(
+    "chat_llm_endpoint_events_total", "Requests, failures, ejections and hedges per upstream endpoint", ("endpoint", "event"),
+    callback=lambda: {
+        (endpoint.name, event): value
+        for endpoint in ai_model.pool.endpoints for event, value in endpoint.stats.items()
+    }
+)
@@ -0,0 +1,74 @@
+"""
+Bounded concurrency primitives for calls to upstream services.
+Keeps slow LLM completions from piling up without limit on the event loop.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a call cannot be admitted because the wait queue is full."""
+
+class ConcurrencyLimiter:
+    def __init__(self, name, max_in_flight, max_queue, timeout, queue_timeout=None):
+        """
+        Args:
+            name (str): Name used in log messages
+            max_in_flight (int): Maximum number of calls running at the same time
+            max_queue (int): Maximum number of calls waiting for a free slot
+            timeout (float): Per-call timeout in seconds
+            queue_timeout (float): Maximum time to wait for a free slot, defaults to timeout
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout if queue_timeout is not None else timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one in-flight slot for the duration of the block.
+
+        Raises:
+            QueueFullError: If all slots are busy and the wait queue is full
+            asyncio.TimeoutError: If no slot became free within queue_timeout
+        """
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            logger.warning(f"{self.name}: wait queue full ({self.waiting} waiting)")
+            raise QueueFullError(f"{self.name} is over capacity")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def run(self, call, timeout=None):
+        """
+        Run a coroutine factory inside a slot with a per-call timeout.
+
+        Args:
+            call (callable): Zero-argument function returning an awaitable
+            timeout (float): Overrides the limiter's per-call timeout
+
+        Returns:
+            The result of the awaited call
+        """
+        async with self.slot():
+            return await asyncio.wait_for(call(), timeout=timeout or self.timeout)
@@ -1,43 +1,117 @@
 """
 Custom content filter to block joke-related content in the chatbot.
 This is a lightweight alternative to NeMo-Guardrails.
+
+Blocked phrases are loaded from the JSON pattern sets in app/filters, optionally extended with
+the utterances of a `define user ...` block from the guardrails Colang files, and compiled into
+a single PhraseMatcher so the cost per message does not grow with the size of the blocklist.
 """
 
+import os
 import re
+import json
+import random
 import logging
 
+try:
+    from .matcher import PhraseMatcher
+except ImportError:
+    from app.matcher import PhraseMatcher
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FILTERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filters")
+
+def load_colang_utterances(path, define):
+    """
+    Read the quoted utterances of a `define ...` block from a Colang file.
+
+    Args:
+        path (str): Path to the .co file
+        define (str): Name of the block, e.g. "user ask for joke"
+
+    Returns:
+        list: The utterances, empty if the file or block does not exist
+    """
+    utterances = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        logger.warning(f"Could not read Colang file {path}: {str(e)}")
+        return utterances
+
+    in_block = False
+    for line in lines:
+        if line.startswith("define "):
+            in_block = line[len("define "):].strip() == define
+            continue
+        if in_block:
+            match = re.match(r'\s+"(.*)"\s*$', line)
+            if match:
+                utterances.append(match.group(1))
+    return utterances
+
+def load_colang_flow_keywords(path, flow):
+    """
+    Read the quoted keywords of `... contains "..."` conditions in a `define flow ...` block.
+
+    Args:
+        path (str): Path to the .co file
+        flow (str): Name of the flow, e.g. "check output for jokes"
+
+    Returns:
+        list: The keywords, empty if the file or flow does not exist
+    """
+    keywords = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        logger.warning(f"Could not read Colang file {path}: {str(e)}")
+        return keywords
+
+    in_flow = False
+    for line in lines:
+        if line.startswith("define "):
+            in_flow = line[len("define "):].strip() == f"flow {flow}"
+            continue
+        if in_flow:
+            keywords.extend(re.findall(r'contains "([^"]*)"', line))
+    return keywords
+
+def load_pattern_set(path):
+    """
+    Load the phrases of a pattern set, including the Colang utterances (`define`) and
+    flow keywords (`flow`) it references.
+
+    Args:
+        path (str): Path to the pattern set JSON file
+
+    Returns:
+        list: The phrases
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    phrases = list(config.get("phrases", []))
+    for rails in config.get("rails", []):
+        rails_path = os.path.normpath(os.path.join(os.path.dirname(path), rails["file"]))
+        if "define" in rails:
+            phrases.extend(load_colang_utterances(rails_path, rails["define"]))
+        if "flow" in rails:
+            phrases.extend(load_colang_flow_keywords(rails_path, rails["flow"]))
+    return phrases
+
 class ContentFilter:
-    def __init__(self):
-        # Patterns for detecting joke-related content
-        self.joke_patterns = [
-            r'\bjoke[s]?\b',
-            r'\bfunny\b',
-            r'\bhumor\b',
-            r'\bcomedy\b',
-            r'\blaugh\b',
-            r'\bpun[s]?\b',
-            r'\bjest\b',
-            r'\bcomical\b',
-            r'\bhilarious\b',
-            r'\bhumorous\b',
-            r'\bcomedy\b',
-            r'\bentertain me\b',
-            r'\bmake me laugh\b',
-            r'\bstand[-\s]?up\b',
-            r'\bhumor me\b',
-            r'\btell me something funny\b',
-            r'\bcheer me up\b',
-            r'\btell me a joke\b',
-            r'\bknow any jokes\b',
-            r'\bgot any jokes\b',
-            r'\bshare a joke\b'
-        ]
-        self.joke_pattern = re.compile('|'.join(self.joke_patterns), re.IGNORECASE)
-        
+    def __init__(self, pattern_set_path=None):
+        # Phrases for detecting joke-related content
+        self.joke_phrases = load_pattern_set(pattern_set_path or os.path.join(FILTERS_DIR, "joke.json"))
+        self.joke_matcher = PhraseMatcher(self.joke_phrases)
+        logger.info(f"Content filter loaded {len(self.joke_matcher)} joke phrases")
+
         # Standard responses for blocked content
         self.joke_responses = [
             "I'm sorry, I'm designed to provide information on medical topics. I'm not able to share jokes or humor content. Is there a medical topic I can help you with instead?",
@@ -45,47 +119,60 @@ class ContentFilter:
             "I'm programmed to focus on medical information rather than humor or jokes. Is there a medical topic you'd like to learn about?",
             "I don't provide jokes or humor content. I'm here to help with medical information and questions. What medical topic would you like to explore?"
         ]
-    
+
     def contains_joke_request(self, text):
         """
         Check if the text contains a request for jokes or humor.
-        
+
         Args:
             text (str): The text to check
-            
+
         Returns:
             bool: True if the text contains a joke request, False otherwise
         """
-        if self.joke_pattern.search(text):
-            logger.info(f"Blocked joke content request: {text}")
+        phrase = self.joke_matcher.search(text)
+        if phrase is not None:
+            # Only the matched phrase is logged, never the user's text
+            logger.debug(f"Blocked joke content request matching '{phrase}'")
             return True
         return False
-    
+
     def get_joke_response(self):
         """
         Get a random response for joke requests.
-        
+
         Returns:
             str: A response message for joke requests
         """
-        import random
         return random.choice(self.joke_responses)
-    
+
     def filter_message(self, message):
         """
         Filter a message and return appropriate response if it contains blocked content.
-        
+
         Args:
             message (str): The message to filter
-            
+
         Returns:
             tuple: (is_blocked, response). If is_blocked is True, response contains the
                   appropriate message to return. If False, response is None.
         """
         if self.contains_joke_request(message):
             return True, self.get_joke_response()
-        
+
         return False, None
 
+    def filter_messages(self, messages):
+        """
+        Filter a batch of messages.
+
+        Args:
+            messages (list): The messages to filter
+
+        Returns:
+            list: One (is_blocked, response) tuple per message, as returned by filter_message
+        """
+        return [self.filter_message(message) for message in messages]
+
 # Create a singleton instance
-content_filter = ContentFilter() 
\ No newline at end of file
+content_filter = ContentFilter()
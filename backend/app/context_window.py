@@ -0,0 +1,116 @@
+"""
+Token-budgeted context window for prompts.
+Keeps the most recent turns within a budget and folds older turns into a rolling summary
+that is stored on the conversation and extended incrementally.
+"""
+
+import os
+import re
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rough average for English text with OpenAI-style tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a piece of text.
+
+    Args:
+        text (str): The text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _read_message(msg):
+    if isinstance(msg, dict):
+        return msg.get("sender", "unknown"), msg.get("content", "") or ""
+    return getattr(msg, "sender", "unknown"), getattr(msg, "content", "") or ""
+
+class ContextWindow:
+    def __init__(self, max_tokens, summary_max_tokens, min_recent_messages=2, refill_ratio=0.75):
+        """
+        Args:
+            max_tokens (int): Token budget for the recent messages sent verbatim
+            summary_max_tokens (int): Token budget for the rolling summary
+            min_recent_messages (int): Messages always kept verbatim, even over budget
+            refill_ratio (float): When the window overflows, older turns are folded until the
+                window is back under this fraction of the budget, so the summary is only
+                extended every few turns instead of on every turn
+        """
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.min_recent_messages = min_recent_messages
+        self.refill_ratio = refill_ratio
+
+    def _window_start(self, messages, budget, floor):
+        """Index of the oldest message that still fits in the budget, never below floor"""
+        start = len(messages)
+        used = 0
+        while start > floor:
+            sender, content = _read_message(messages[start - 1])
+            cost = estimate_tokens(f"{sender}: {content}")
+            if used + cost > budget and len(messages) - start >= self.min_recent_messages:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def _summarize_message(self, msg, max_chars=200):
+        """Condense a message to its first sentence for the summary"""
+        sender, content = _read_message(msg)
+        text = " ".join(content.split())
+        first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        if len(first_sentence) > max_chars:
+            first_sentence = first_sentence[:max_chars].rstrip() + "..."
+        return f"{sender.capitalize()}: {first_sentence}"
+
+    def _fold(self, summary_text, messages):
+        """Extend the summary with the given messages and trim it to the summary budget"""
+        lines = summary_text.split("\n") if summary_text else []
+        lines.extend(self._summarize_message(msg) for msg in messages)
+        # Drop the oldest lines once the summary outgrows its budget
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def select(self, messages, summary=None):
+        """
+        Select the messages to send verbatim and bring the rolling summary up to date.
+
+        Args:
+            messages (list): All messages of the conversation, oldest first
+            summary (dict): The stored summary, {"text": str, "upto": int} where upto is the
+                number of leading messages already folded into the text
+
+        Returns:
+            tuple: (recent_messages, summary, changed) where changed is True if the summary
+                   was extended and should be persisted
+        """
+        summary = summary or {"text": "", "upto": 0}
+        upto = min(summary.get("upto", 0), len(messages))
+
+        start = self._window_start(messages, self.max_tokens, upto)
+        if start == upto:
+            # Everything after the summary fits in the budget
+            return messages[start:], summary, False
+
+        # Fold enough older turns to get comfortably back under the budget
+        start = self._window_start(messages, int(self.max_tokens * self.refill_ratio), upto)
+        summary = {
+            "text": self._fold(summary.get("text", ""), messages[upto:start]),
+            "upto": start,
+        }
+        logger.debug(f"Folded {start - upto} messages into the context summary")
+        return messages[start:], summary, True
+
+# Create a singleton instance
+context_window = ContextWindow(
+    max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "2000")),
+    summary_max_tokens=int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400")),
+)
@@ -0,0 +1,246 @@
+"""
+In-process cache of recently active conversations.
+Entries are kept up to date by the write paths of this worker and dropped when another
+worker announces a write through a capped MongoDB collection it tails.
+"""
+
+import asyncio
+import os
+import uuid
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EVENTS_COLLECTION = "conversation_events"
+# Size of the capped events collection, old events are overwritten
+EVENTS_SIZE_BYTES = 8 * 1024 * 1024
+# Pause before tailing again after the events cursor dies
+RETAIL_DELAY = 1.0
+
+def make_etag(version):
+    return f'"v{version}"'
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against an entity tag. Weak tags compare equal to strong ones.
+
+    Args:
+        if_none_match (str): The header value, a list of tags or `*`
+        etag (str): The current entity tag
+
+    Returns:
+        bool: True if the client's copy is current
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+class ConversationCache:
+    def __init__(self, max_entries, enabled=True, invalidation=True):
+        """
+        Args:
+            max_entries (int): Maximum number of conversations kept
+            enabled (bool): When False every lookup is a miss and nothing is stored
+            invalidation (bool): Publish writes to other workers and drop entries on theirs.
+                Only safe to turn off when a single worker serves the API
+        """
+        self.max_entries = max_entries
+        self.enabled = enabled and max_entries > 0
+        self.invalidation = invalidation
+        self.worker_id = str(uuid.uuid4())
+        self.collection = None
+        # conversation id -> (version, conversation as JSON-compatible dict), least recently used first
+        self._entries = OrderedDict()
+        # Incremented on every write so a read that raced with one isn't stored
+        self.generation = 0
+        self._tail_task = None
+        self._publishing = set()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "not_modified": 0,
+            "patched": 0,
+            "invalidations": 0,
+            "remote_invalidations": 0,
+            "evictions": 0,
+        }
+
+    async def bind(self, db):
+        """
+        Create the capped collection used to announce writes to other workers.
+
+        Args:
+            db: The Motor database
+        """
+        if not self.enabled or not self.invalidation:
+            return
+        try:
+            await db.create_collection(EVENTS_COLLECTION, capped=True, size=EVENTS_SIZE_BYTES)
+            # A tailable cursor on an empty capped collection dies at once
+            await db[EVENTS_COLLECTION].insert_one({"worker": self.worker_id, "created_at": datetime.utcnow()})
+        except CollectionInvalid:
+            pass
+        self.collection = db[EVENTS_COLLECTION]
+
+    def start(self):
+        """
+        Start following writes of other workers. Must be called from a running event loop.
+        """
+        if self.collection is not None and self._tail_task is None:
+            self._tail_task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        tasks = [task for task in (self._tail_task, *self._publishing) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tail_task = None
+
+    def get(self, conversation_id):
+        """
+        Returns:
+            tuple: (version, conversation) or None on a miss. The conversation must not be modified
+        """
+        entry = self._entries.get(conversation_id) if self.enabled else None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(conversation_id)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, conversation_id, version, conversation, generation=None):
+        """
+        Store a conversation read from the database.
+
+        Args:
+            version (int): The version it was read at
+            conversation (dict): The conversation as returned by the API
+            generation (int): The generation observed before the read. If a write happened
+                since, the read may predate it and is not stored
+        """
+        if not self.enabled or (generation is not None and generation != self.generation):
+            return
+        entry = self._entries.get(conversation_id)
+        if entry and entry[0] >= version:
+            return
+        self._entries[conversation_id] = (version, conversation)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def append_message(self, conversation_id, message, version, position=None):
+        """
+        Apply a message appended by this worker. The entry is only patched if it holds the
+        version right before the append and, when given, exactly the messages before position,
+        otherwise it is dropped.
+
+        Args:
+            message (dict): The message as returned by the API
+            version (int): The conversation version after the append
+            position (int): Index of the message in the conversation, when the version was
+                incremented after the message was stored and a reader may have seen either
+        """
+        if not self.enabled:
+            return
+        self.generation += 1
+        entry = self._entries.get(conversation_id)
+        if (entry and version is not None and entry[0] == version - 1
+                and (position is None or len(entry[1]["messages"]) == position)):
+            _, conversation = entry
+            conversation = {**conversation, "messages": conversation["messages"] + [message]}
+            self._entries[conversation_id] = (version, conversation)
+            self.stats["patched"] += 1
+        elif entry:
+            del self._entries[conversation_id]
+            self.stats["invalidations"] += 1
+        self._publish(conversation_id, version)
+
+    def invalidate(self, conversation_id, version=None):
+        """
+        Drop a conversation after a write by this worker and tell the other workers.
+
+        Args:
+            version (int): The conversation version after the write, if known
+        """
+        if not self.enabled:
+            return
+        self._drop(conversation_id, version)
+        self._publish(conversation_id, version)
+
+    def _drop(self, conversation_id, version=None):
+        self.generation += 1
+        entry = self._entries.get(conversation_id)
+        if entry and (version is None or entry[0] < version):
+            del self._entries[conversation_id]
+            return True
+        return False
+
+    def _publish(self, conversation_id, version):
+        if self.collection is None:
+            return
+        # Fire and forget, the write path doesn't wait for other workers
+        task = asyncio.create_task(self._insert_event(conversation_id, version))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _insert_event(self, conversation_id, version):
+        try:
+            await self.collection.insert_one({
+                "conversation_id": conversation_id,
+                "version": version,
+                "worker": self.worker_id,
+                "created_at": datetime.utcnow()
+            })
+        except Exception as e:
+            logger.warning(f"Failed to publish conversation {conversation_id} invalidation: {str(e)}")
+
+    async def _tail(self):
+        # Only events published after startup matter, start after the newest one
+        last = await self.collection.find_one({}, sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for event in cursor:
+                    last_id = event["_id"]
+                    if event.get("worker") == self.worker_id or "conversation_id" not in event:
+                        continue
+                    if self._drop(event["conversation_id"], event.get("version")):
+                        self.stats["remote_invalidations"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries may be stale while the cursor is down, start over without them
+                logger.warning(f"Conversation invalidation feed failed: {str(e)}")
+                self._entries.clear()
+            await asyncio.sleep(RETAIL_DELAY)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Hit, miss, patch and invalidation counters plus the current size
+        """
+        return {**self.stats, "size": len(self._entries), "max_entries": self.max_entries}
+
+# Create a singleton instance
+conversation_cache = ConversationCache(
+    max_entries=int(os.getenv("CONVERSATION_CACHE_SIZE", "1000")),
+    invalidation=os.getenv("CONVERSATION_CACHE_INVALIDATION", "true").lower() == "true",
+)
@@ -0,0 +1,118 @@
+"""
+Streaming JSONL export of conversations.
+Documents are read from a MongoDB cursor and written one line at a time, so memory use
+stays constant regardless of the size of the export.
+"""
+
+import zlib
+import logging
+try:
+    from .serialization import dumps, conversation_response
+except ImportError:
+    from app.serialization import dumps, conversation_response
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields read for each conversation. Lines are shaped like the Conversation model, so
+# internal message fields such as pending improvements are not exported
+EXPORT_PROJECTION = {"_id": 0, "id": 1, "created_at": 1, "is_negative": 1, "messages": 1}
+
+# Conditions on a conversation's messages for the `messages` export filter
+MESSAGE_FILTERS = {
+    "all": None,
+    "rated": {"rating": {"$in": ["up", "down"]}},
+    "improved": {"is_improved": True},
+    "rated_or_improved": {"$or": [{"rating": {"$in": ["up", "down"]}}, {"is_improved": True}]},
+}
+
+def build_export_filter(include_negative=False, messages="all", start=None, end=None, resume_after=None,
+                        embedded_messages=True):
+    """
+    Build the MongoDB filter for an export.
+
+    Args:
+        include_negative (bool): Include conversations marked as negative
+        messages (str): Key of MESSAGE_FILTERS; conversations need at least one matching message
+        start (datetime): Only conversations created at or after this time
+        end (datetime): Only conversations created before this time
+        resume_after (dict): Conversation (with `created_at` and `id`) to resume after
+        embedded_messages (bool): False when messages may live in the messages collection, where
+            the message filter can only be checked once they are loaded, see stream_jsonl
+
+    Returns:
+        dict: The filter
+    """
+    conditions = []
+    if not include_negative:
+        conditions.append({"is_negative": {"$ne": True}})
+    if MESSAGE_FILTERS.get(messages):
+        condition = {"messages": {"$elemMatch": MESSAGE_FILTERS[messages]}}
+        if not embedded_messages:
+            condition = {"$or": [condition, {"messages": {"$exists": False}}]}
+        conditions.append(condition)
+
+    created_at = {}
+    if start:
+        created_at["$gte"] = start
+    if end:
+        created_at["$lt"] = end
+    if created_at:
+        conditions.append({"created_at": created_at})
+
+    if resume_after:
+        conditions.append({"$or": [
+            {"created_at": {"$gt": resume_after["created_at"]}},
+            {"created_at": resume_after["created_at"], "id": {"$gt": resume_after["id"]}}
+        ]})
+
+    return {"$and": conditions} if conditions else {}
+
+async def stream_jsonl(collection, query, compress=False, batch_size=200, load_messages=None):
+    """
+    Yield conversations matching a query as JSONL, oldest first.
+
+    Args:
+        collection: The Motor collection of conversations
+        query (dict): Filter from build_export_filter
+        compress (bool): Yield a gzip stream instead of plain text
+        batch_size (int): Documents fetched per round trip and lines per yielded chunk
+        load_messages (callable): Awaited with each batch of conversations, returns them with
+            their messages and without those failing the message filter
+
+    Yields:
+        bytes: Chunks of the export
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    cursor = collection.find(query, EXPORT_PROJECTION).sort([("created_at", 1), ("id", 1)]).batch_size(batch_size)
+
+    exported = 0
+
+    async def encode(batch):
+        nonlocal exported
+        if load_messages:
+            batch = await load_messages(batch)
+        exported += len(batch)
+        if not batch:
+            return b""
+        chunk = b"\n".join(dumps(conversation_response(conversation)) for conversation in batch) + b"\n"
+        return compressor.compress(chunk) if compressor else chunk
+
+    batch = []
+    async for conversation in cursor:
+        batch.append(conversation)
+        if len(batch) >= batch_size:
+            chunk = await encode(batch)
+            batch = []
+            if chunk:
+                yield chunk
+
+    if batch:
+        chunk = await encode(batch)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+    logger.info(f"Exported {exported} conversations")
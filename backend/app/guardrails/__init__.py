@@ -1,5 +1,6 @@
-from nemoguardrails import LLMRails, RailsConfig
+import asyncio
 import os
+import time
 import logging
 
 # Configure logging
@@ -9,20 +10,24 @@ logger = logging.getLogger(__name__)
 def get_guardrails():
     """
     Initialize and return the NeMo-Guardrails configuration.
+    This is slow, so it is called from a worker thread by GuardrailsManager.
     """
     try:
+        # Imported here so that importing this package stays cheap
+        from nemoguardrails import LLMRails, RailsConfig
+
         # Get the directory of the current file
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        
+
         # Path to the guardrails config directory
         config_dir = os.path.join(current_dir, "config")
-        
+
         # Load the rails configuration from the config directory
         config = RailsConfig.from_path(config_dir)
-        
+
         # Initialize the rails with the configuration
         rails = LLMRails(config)
-        
+
         logger.info("NeMo Guardrails successfully initialized")
         return rails
     except Exception as e:
@@ -30,5 +35,137 @@ def get_guardrails():
         # Return None in case of error, so the application can handle this gracefully
         return None
 
-# Create a singleton instance
-guardrails = get_guardrails() 
\ No newline at end of file
+class GuardrailsManager:
+    """
+    Builds the rails lazily in the background and exposes a readiness state.
+    Until the rails are ready, callers are expected to use the local content filter path.
+    """
+
+    def __init__(self, enabled=True, timeout=20.0, warm_up=True):
+        """
+        Args:
+            enabled (bool): When False the rails are never loaded
+            timeout (float): Time budget in seconds for a single rails invocation
+            warm_up (bool): Run one generation after loading so the first request doesn't pay for it
+        """
+        self.enabled = enabled
+        self.timeout = timeout
+        self.warm_up = warm_up
+        self.rails = None
+        self.state = "idle" if enabled else "disabled"
+        self.load_seconds = None
+        self._task = None
+
+    @property
+    def is_ready(self):
+        return self.state == "ready"
+
+    def start(self):
+        """
+        Start loading the rails in the background. Must be called from a running event loop.
+        Calling it again while loading or once loaded does nothing.
+        """
+        if self.state != "idle":
+            return
+        self.state = "loading"
+        self._task = asyncio.create_task(self._load())
+
+    async def _load(self):
+        started = time.perf_counter()
+        rails = await asyncio.to_thread(get_guardrails)
+        if rails is None:
+            self.state = "failed"
+            return
+
+        self.rails = rails
+        if self.warm_up:
+            self.state = "warming"
+            try:
+                await asyncio.wait_for(
+                    rails.generate_async(messages=[{"role": "user", "content": "Hello"}]),
+                    timeout=self.timeout
+                )
+            except Exception as e:
+                # The rails are usable even if warm-up failed, e.g. on a slow first upstream call
+                logger.warning(f"NeMo Guardrails warm-up failed: {str(e)}")
+
+        self.load_seconds = time.perf_counter() - started
+        self.state = "ready"
+        logger.info(f"NeMo Guardrails ready after {self.load_seconds:.1f}s")
+
+    async def _generate(self, messages, rails):
+        """Run the rails, optionally restricted to some rail types, and return the bot message"""
+        if rails is None:
+            return await self.rails.generate_async(messages=messages)
+        try:
+            result = await self.rails.generate_async(messages=messages, options={"rails": rails})
+        except TypeError:
+            # Releases without generation options always run every rail
+            return await self.rails.generate_async(messages=messages)
+        # With options the rails return a GenerationResponse instead of a message
+        response = getattr(result, "response", result)
+        if isinstance(response, list):
+            return response[-1] if response else None
+        if isinstance(response, str):
+            return {"role": "assistant", "content": response}
+        return response
+
+    async def generate_response(self, messages, rails=None, timeout=None):
+        """
+        Generate a response through the rails without blocking the event loop.
+
+        Args:
+            messages (list): Messages as {"role": ..., "content": ...} dicts
+            rails (list): Rail types to run, e.g. ["input", "dialog"]; all of them if None
+            timeout (float): Overrides the default time budget
+
+        Returns:
+            dict: The bot message, or None if the rails are not ready
+
+        Raises:
+            asyncio.TimeoutError: If the rails did not answer within the time budget
+        """
+        if not self.is_ready:
+            return None
+        return await asyncio.wait_for(self._generate(messages, rails), timeout=timeout or self.timeout)
+
+    async def check_output(self, messages, response, timeout=None):
+        """
+        Run only the output rails on a bot response.
+
+        Args:
+            messages (list): The conversation the response answers
+            response (str): The bot response
+            timeout (float): Overrides the default time budget
+
+        Returns:
+            str: The response, possibly rewritten by the rails, or None if the rails are not ready
+        """
+        if not self.is_ready:
+            return None
+        result = await asyncio.wait_for(
+            self._generate(messages + [{"role": "assistant", "content": response}], ["output"]),
+            timeout=timeout or self.timeout
+        )
+        return result["content"] if result else response
+
+    async def stop(self):
+        """
+        Cancel a load that is still in progress.
+        """
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def status(self):
+        """
+        Returns:
+            dict: The readiness state and how long loading took
+        """
+        return {"state": self.state, "load_seconds": self.load_seconds}
+
+# Create a singleton instance, the rails themselves are loaded on start()
+guardrails = GuardrailsManager(
+    enabled=os.getenv("GUARDRAILS_ENABLED", "true").lower() == "true",
+    timeout=float(os.getenv("GUARDRAILS_TIMEOUT", "20")),
+    warm_up=os.getenv("GUARDRAILS_WARM_UP", "true").lower() == "true",
+)
@@ -0,0 +1,302 @@
+"""
+Durable background job queue backed by a MongoDB collection.
+Jobs are claimed by a bounded pool of workers in priority order, retried with backoff when
+they fail, and survive restarts: a job whose worker died is claimed again once its lease expires.
+"""
+
+import asyncio
+import os
+import uuid
+import logging
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+class PermanentJobError(Exception):
+    """Raised by a job handler to fail a job without retrying it."""
+
+class JobQueue:
+    def __init__(self, name, concurrency, max_attempts, lease, poll_interval, retry_delay):
+        """
+        Args:
+            name (str): Name used in log messages
+            concurrency (int): Number of jobs run at the same time by this process
+            max_attempts (int): Attempts before a job is marked as failed
+            lease (float): Seconds a claimed job stays reserved for its worker. The worker renews
+                it while the job runs; a job whose lease expired is considered abandoned and
+                claimed again
+            poll_interval (float): Seconds between polls for jobs enqueued by other processes
+            retry_delay (float): Delay in seconds before the first retry, doubled on each attempt
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.collection = None
+        self.handler = None
+        # Recorded on claimed jobs, so only the claiming worker renews and finishes them
+        self.worker_id = str(uuid.uuid4())
+        self.running = 0
+        self._workers = []
+        self._wake_up = None
+        # job id -> event set when the job finishes in this process
+        self._finished = {}
+        self.stats = {
+            "enqueued": 0,
+            "completed": 0,
+            "retried": 0,
+            "failed": 0,
+        }
+
+    def bind(self, collection, handler):
+        """
+        Args:
+            collection: The Motor collection holding the jobs
+            handler (callable): Awaited with the job document, returns the job result.
+                Raise PermanentJobError for failures a retry can't fix
+        """
+        self.collection = collection
+        self.handler = handler
+
+    def start(self):
+        """
+        Start the worker pool. Must be called from a running event loop.
+        """
+        if self._workers or self.concurrency <= 0:
+            return
+        self._wake_up = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} {self.name} workers")
+
+    async def stop(self):
+        """
+        Cancel the workers. Jobs they were running are claimed again after their lease expires.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, payload, priority=0, dedupe_key=None):
+        """
+        Add a job to the queue.
+
+        Args:
+            payload (dict): Passed to the handler as job["payload"]
+            priority (int): Higher priorities are claimed first
+            dedupe_key (str): If a queued or running job has the same key, it is returned instead
+
+        Returns:
+            dict: The job document
+        """
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": QUEUED,
+            "priority": priority,
+            "payload": payload,
+            "dedupe_key": dedupe_key,
+            "attempts": 0,
+            "run_after": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if dedupe_key is None:
+            await self.collection.insert_one(dict(job))
+        else:
+            # Inserted only if no job with the key is active, in one atomic upsert backed by
+            # the partial unique index on active dedupe keys
+            inserted = {field: value for field, value in job.items() if field != "dedupe_key"}
+            for attempt in range(2):
+                try:
+                    existing = await self.collection.find_one_and_update(
+                        {"dedupe_key": dedupe_key, "status": {"$in": [QUEUED, RUNNING]}},
+                        {"$setOnInsert": inserted},
+                        projection={"_id": 0},
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER
+                    )
+                    break
+                except DuplicateKeyError:
+                    # Another process inserted the same job between our lookup and insert
+                    if attempt:
+                        raise
+            if existing["id"] != job["id"]:
+                return existing
+
+        self.stats["enqueued"] += 1
+        if self._wake_up is not None:
+            self._wake_up.set()
+        return job
+
+    async def get(self, job_id):
+        """
+        Returns:
+            dict: The job document without its payload, or None if it doesn't exist
+        """
+        return await self.collection.find_one({"id": job_id}, {"_id": 0, "payload": 0, "dedupe_key": 0, "worker": 0})
+
+    async def wait(self, job_id, timeout):
+        """
+        Wait until a job finishes in this process or the timeout elapses, whichever comes first.
+        Jobs run by other processes are only noticed by polling get().
+        """
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if not event.is_set():
+                self._finished.pop(job_id, None)
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED, "run_after": {"$lte": now}},
+                # Abandoned by a worker that stopped or crashed
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _claimed(self, job):
+        # Matches the job only while this claim of it holds, not after another worker took it over
+        return {"id": job["id"], "status": RUNNING, "worker": self.worker_id, "attempts": job["attempts"]}
+
+    async def _renew(self, job):
+        """
+        Extend the lease of a running job every third of the lease, until cancelled or the
+        job was claimed again by another worker.
+        """
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            now = datetime.utcnow()
+            try:
+                result = await self.collection.update_one(
+                    self._claimed(job),
+                    {"$set": {"lease_expires_at": now + timedelta(seconds=self.lease), "updated_at": now}}
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to renew the lease of {self.name} job {job['id']}: {str(e)}")
+                continue
+            if not result.matched_count:
+                logger.warning(f"{self.name} job {job['id']} lost its lease")
+                return
+
+    async def _finish(self, job, update):
+        update["updated_at"] = datetime.utcnow()
+        result = await self.collection.update_one(self._claimed(job), {"$set": update})
+        if not result.matched_count:
+            # Claimed again after the lease expired, the outcome of that run is kept
+            logger.warning(f"Dropped the outcome of {self.name} job {job['id']} attempt {job['attempts']}, it lost its lease")
+            return
+        if update["status"] in FINISHED_STATES:
+            event = self._finished.pop(job["id"], None)
+            if event is not None:
+                event.set()
+
+    async def _run(self, job):
+        renewal = asyncio.create_task(self._renew(job))
+        try:
+            try:
+                result = await self.handler(job)
+            finally:
+                renewal.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError) and job["attempts"] < self.max_attempts
+            logger.warning(f"{self.name} job {job['id']} attempt {job['attempts']} failed: {str(e)}")
+            if retry:
+                self.stats["retried"] += 1
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                await self._finish(job, {
+                    "status": QUEUED,
+                    "error": str(e),
+                    "run_after": datetime.utcnow() + timedelta(seconds=delay)
+                })
+            else:
+                self.stats["failed"] += 1
+                await self._finish(job, {"status": FAILED, "error": str(e), "finished_at": datetime.utcnow()})
+            return
+
+        self.stats["completed"] += 1
+        await self._finish(job, {"status": DONE, "result": result, "error": None, "finished_at": datetime.utcnow()})
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to claim a {self.name} job: {str(e)}")
+                job = None
+
+            if job is None:
+                # Sleep until a local enqueue or the next poll for jobs from other processes
+                self._wake_up.clear()
+                try:
+                    await asyncio.wait_for(self._wake_up.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job["attempts"] > self.max_attempts:
+                self.stats["failed"] += 1
+                await self._finish(job, {"status": FAILED, "error": "Too many attempts", "finished_at": datetime.utcnow()})
+                continue
+
+            self.running += 1
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to record the outcome of {self.name} job {job['id']}: {str(e)}")
+            finally:
+                self.running -= 1
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Job counters of this process and the number of jobs it is running
+        """
+        return {**self.stats, "running": self.running, "workers": len(self._workers)}
+
+# Create a singleton instance for improved response generation. A small pool keeps admin
+# bulk work from taking more than a few of the upstream completion slots used by chat
+improvement_jobs = JobQueue(
+    "improvement",
+    concurrency=int(os.getenv("IMPROVE_WORKERS", "2")),
+    max_attempts=int(os.getenv("IMPROVE_MAX_ATTEMPTS", "3")),
+    lease=float(os.getenv("IMPROVE_JOB_LEASE", "300")),
+    poll_interval=float(os.getenv("IMPROVE_POLL_INTERVAL", "2")),
+    retry_delay=float(os.getenv("IMPROVE_RETRY_DELAY", "5")),
+)
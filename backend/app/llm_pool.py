@@ -0,0 +1,333 @@
+"""
+Pool of OpenAI-compatible completion endpoints.
+Each call goes to the endpoint with the fewest outstanding requests. Endpoints that keep
+failing are ejected for a while, and a completion slower than an endpoint's usual latency
+can be hedged with a duplicate sent to another endpoint, keeping whichever answers first.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import logging
+from collections import deque
+
+import openai
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Completions kept per endpoint to estimate its latency percentiles
+LATENCY_WINDOW = 200
+# Samples needed before an endpoint's percentile is trusted for hedging
+MIN_LATENCY_SAMPLES = 20
+
+def load_endpoint_specs():
+    """
+    Read the endpoint configuration from the environment.
+    LLM_ENDPOINTS is a JSON list of {"name", "api_base", "api_key", "model"} objects where
+    every key is optional and defaults to OPENAI_API_BASE, OPENAI_API_KEY and OPENAI_MODEL.
+    Without it the pool has the single endpoint those variables describe.
+
+    Returns:
+        list: Endpoint specs as dicts
+    """
+    default = {
+        "api_base": os.getenv("OPENAI_API_BASE"),
+        "api_key": os.getenv("OPENAI_API_KEY", "your-api-key"),
+        "model": os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+    }
+    specs = json.loads(os.getenv("LLM_ENDPOINTS") or "[]") or [{}]
+    endpoints = []
+    for i, spec in enumerate(specs):
+        spec = {**default, **spec}
+        spec.setdefault("name", spec["api_base"] or f"endpoint-{i}")
+        endpoints.append(spec)
+    return endpoints
+
+class Endpoint:
+    """
+    One completion backend with its own keep-alive connection pool: an AsyncOpenAI client
+    with openai>=1, or an aiohttp session used for every call with the pinned legacy package
+    """
+
+    def __init__(self, name, api_key, model, api_base=None, timeout=60.0):
+        self.name = name
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.timeout = timeout
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"requests": 0, "failures": 0, "ejections": 0, "hedges": 0, "hedge_wins": 0}
+
+        # openai>=1 clients keep their own connection pool
+        try:
+            self.client = openai.AsyncOpenAI(api_key=api_key, base_url=api_base, timeout=timeout)
+            self.is_new_client = True
+        except (AttributeError, TypeError):
+            # The legacy package opens a new session per call unless one is set in
+            # openai.aiosession, so the endpoint keeps its own, created on first use
+            self.client = None
+            self.is_new_client = False
+        self.session = None
+
+    @property
+    def is_ejected(self):
+        return self.ejected_until > time.monotonic()
+
+    def latency_percentile(self, percentile):
+        """
+        Returns:
+            float: The latency in seconds below which `percentile` percent of recent
+                   completions finished, or None without enough samples
+        """
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)]
+
+    def _legacy_options(self):
+        options = {"api_key": self.api_key, "request_timeout": self.timeout}
+        if self.api_base:
+            options["api_base"] = self.api_base
+        return options
+
+    async def _legacy_create(self, **kwargs):
+        """Run ChatCompletion.acreate over this endpoint's session"""
+        if self.session is None or self.session.closed:
+            # Installed with the legacy package
+            import aiohttp
+            self.session = aiohttp.ClientSession()
+        # aiosession is a context variable, so concurrent calls to other endpoints keep theirs.
+        # A stream keeps the session it was opened with
+        token = openai.aiosession.set(self.session)
+        try:
+            return await openai.ChatCompletion.acreate(model=self.model, **kwargs, **self._legacy_options())
+        finally:
+            openai.aiosession.reset(token)
+
+    async def close(self):
+        """Close the endpoint's connections"""
+        if self.is_new_client:
+            await self.client.close()
+        elif self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def complete(self, messages, max_tokens):
+        """
+        Returns:
+            tuple: (content, usage) where usage is (prompt_tokens, completion_tokens) or None
+                   for backends that don't report it
+        """
+        if self.is_new_client:
+            # New client version
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens
+            )
+            content = response.choices[0].message.content.strip()
+            usage = response.usage
+            return content, (usage.prompt_tokens, usage.completion_tokens) if usage else None
+
+        # Old client version, acreate is natively async
+        response = await self._legacy_create(messages=messages, max_tokens=max_tokens)
+        content = response['choices'][0]['message']['content'].strip()
+        usage = response.get('usage')
+        return content, (usage['prompt_tokens'], usage['completion_tokens']) if usage else None
+
+    async def stream(self, messages, max_tokens):
+        """
+        Yields:
+            str: The completion text chunk by chunk
+        """
+        if self.is_new_client:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True
+            )
+        else:
+            stream = await self._legacy_create(messages=messages, max_tokens=max_tokens, stream=True)
+
+        async for chunk in stream:
+            if self.is_new_client:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+            else:
+                token = chunk['choices'][0]['delta'].get('content') if chunk['choices'] else None
+            if token:
+                yield token
+
+    def status(self):
+        return {
+            "name": self.name,
+            "model": self.model,
+            "outstanding": self.outstanding,
+            "ejected": self.is_ejected,
+            "p50_seconds": self.latency_percentile(50),
+            "p95_seconds": self.latency_percentile(95),
+            **self.stats,
+        }
+
+class ProviderPool:
+    def __init__(self, endpoints, hedge_percentile=0, hedge_min_delay=0.5, eject_after=3, eject_seconds=30.0):
+        """
+        Args:
+            endpoints (list): Endpoint instances
+            hedge_percentile (float): Send a duplicate to another endpoint when a completion takes
+                longer than this percentile of its endpoint's recent latencies, 0 to disable
+            hedge_min_delay (float): Never hedge before this many seconds
+            eject_after (int): Consecutive failures after which an endpoint is ejected
+            eject_seconds (float): How long an ejected endpoint receives no traffic
+        """
+        if not endpoints:
+            raise ValueError("The provider pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+
+    def pick(self, exclude=()):
+        """
+        Choose the available endpoint with the fewest outstanding requests.
+        If every endpoint is ejected, the one whose ejection ends first is used anyway.
+
+        Returns:
+            Endpoint: The endpoint, or None if all of them are excluded
+        """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        available = [endpoint for endpoint in candidates if not endpoint.is_ejected]
+        if not available:
+            return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+        fewest = min(endpoint.outstanding for endpoint in available)
+        # Random among ties so idle endpoints share the load
+        return random.choice([endpoint for endpoint in available if endpoint.outstanding == fewest])
+
+    def _record_success(self, endpoint, seconds=None):
+        endpoint.consecutive_failures = 0
+        if seconds is not None:
+            endpoint.latencies.append(seconds)
+
+    def _record_failure(self, endpoint, error):
+        endpoint.stats["failures"] += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.eject_after:
+            endpoint.consecutive_failures = 0
+            endpoint.ejected_until = time.monotonic() + self.eject_seconds
+            endpoint.stats["ejections"] += 1
+            logger.warning(f"Ejected LLM endpoint {endpoint.name} for {self.eject_seconds:.0f}s after {self.eject_after} failures: {str(error)}")
+
+    async def _call(self, endpoint, messages, max_tokens):
+        endpoint.outstanding += 1
+        endpoint.stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            result = await endpoint.complete(messages, max_tokens)
+        except asyncio.CancelledError:
+            # Lost a hedge race or the caller gave up, not the endpoint's fault
+            raise
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        self._record_success(endpoint, time.perf_counter() - started)
+        return result
+
+    def _hedge_delay(self, endpoint):
+        if not self.hedge_percentile or len(self.endpoints) < 2:
+            return None
+        percentile = endpoint.latency_percentile(self.hedge_percentile)
+        if percentile is None:
+            return None
+        return max(percentile, self.hedge_min_delay)
+
+    async def complete(self, messages, max_tokens):
+        """
+        Run a chat completion on the least loaded endpoint. A failed call is retried once on
+        another endpoint, and a slow one may be hedged on another endpoint.
+
+        Returns:
+            tuple: (content, usage) as from Endpoint.complete
+        """
+        primary = self.pick()
+        tried = {primary}
+        pending = {asyncio.create_task(self._call(primary, messages, max_tokens))}
+        hedges = {}
+        error = None
+        try:
+            delay = self._hedge_delay(primary)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                backup = None if done else self.pick(exclude=tried)
+                if backup is not None:
+                    primary.stats["hedges"] += 1
+                    tried.add(backup)
+                    hedge = asyncio.create_task(self._call(backup, messages, max_tokens))
+                    hedges[hedge] = backup
+                    pending.add(hedge)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task in hedges:
+                            hedges[task].stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    # Fail over once to an endpoint that hasn't been tried
+                    backup = self.pick(exclude=tried) if len(tried) < 2 else None
+                    if backup is not None:
+                        tried.add(backup)
+                        pending.add(asyncio.create_task(self._call(backup, messages, max_tokens)))
+            raise error
+        finally:
+            # Cancel the loser of a hedge race
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, messages, max_tokens):
+        """
+        Stream a chat completion from the least loaded endpoint. Streams are not hedged,
+        since tokens already sent to the client can't be taken back.
+
+        Yields:
+            str: The completion text chunk by chunk
+        """
+        endpoint = self.pick()
+        endpoint.outstanding += 1
+        endpoint.stats["requests"] += 1
+        try:
+            async for token in endpoint.stream(messages, max_tokens):
+                yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            raise
+        else:
+            self._record_success(endpoint)
+        finally:
+            endpoint.outstanding -= 1
+
+    async def close(self):
+        """Close the connections of every endpoint"""
+        await asyncio.gather(*(endpoint.close() for endpoint in self.endpoints), return_exceptions=True)
+
+    def status(self):
+        """
+        Returns:
+            list: Load, health and latency of every endpoint
+        """
+        return [endpoint.status() for endpoint in self.endpoints]
@@ -0,0 +1,142 @@
+"""
+Multi-phrase matcher based on an Aho-Corasick automaton over word tokens.
+Matching cost depends on the length of the text, not on the number of phrases,
+and tokenizing on words gives word-boundary semantics for free.
+"""
+
+import re
+
+# Words are runs of letters, digits and apostrophes; everything else is a boundary
+TOKEN_PATTERN = re.compile(r"[\w'’]+")
+
+# Possessive endings, dropped so "joke's" matches like "joke"
+POSSESSIVE_PATTERN = re.compile(r"['’]s$")
+
+def tokenize(text):
+    """
+    Split text into lowercase word tokens, without possessive endings and apostrophes.
+
+    Args:
+        text (str): The text to tokenize
+
+    Returns:
+        list: The tokens
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        # Other apostrophes are removed, so "don't" is matched by "dont" and the reverse
+        token = POSSESSIVE_PATTERN.sub("", token).replace("'", "").replace("’", "")
+        if token:
+            tokens.append(token)
+    return tokens
+
+class PhraseMatcher:
+    def __init__(self, phrases=()):
+        """
+        Args:
+            phrases (iterable): Phrases to match. Each phrase matches as a sequence of whole words,
+                so "stand up" matches "stand-up" and "stand up" but not "standup"
+        """
+        # State 0 is the root. Each state maps a token to the next state.
+        self._goto = [{}]
+        self._fail = [0]
+        # Phrase ending exactly at each state
+        self._phrase = [None]
+        # Nearest state on the failure chain that ends a phrase, for reporting overlapping matches
+        self._dict_link = [0]
+        self.phrases = []
+        for phrase in phrases:
+            self.add(phrase)
+        self.build()
+
+    def add(self, phrase):
+        """
+        Add a phrase. build() must be called before matching again.
+
+        Args:
+            phrase (str): The phrase to add
+        """
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._phrase.append(None)
+                self._dict_link.append(0)
+            state = next_state
+        if self._phrase[state] is None:
+            self._phrase[state] = phrase
+            self.phrases.append(phrase)
+
+    def build(self):
+        """
+        Compute failure links breadth-first.
+        """
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                suffix = self._fail[next_state]
+                self._dict_link[next_state] = suffix if self._phrase[suffix] is not None else self._dict_link[suffix]
+
+    def _matches(self, text):
+        """Yield each phrase occurrence as the automaton consumes the tokens of the text"""
+        goto = self._goto
+        fail = self._fail
+        phrase = self._phrase
+        dict_link = self._dict_link
+        state = 0
+        for token in tokenize(text):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if phrase[state] is not None:
+                yield phrase[state]
+            # Shorter phrases ending at the same token
+            match_state = dict_link[state]
+            while match_state:
+                yield phrase[match_state]
+                match_state = dict_link[match_state]
+
+    def search(self, text):
+        """
+        Find the first phrase occurring in the text.
+
+        Args:
+            text (str): The text to scan
+
+        Returns:
+            str: The matched phrase, or None if nothing matches
+        """
+        return next(self._matches(text), None)
+
+    def find_all(self, text):
+        """
+        Find every phrase occurrence in the text, including overlapping ones.
+
+        Args:
+            text (str): The text to scan
+
+        Returns:
+            list: The matched phrases, in order of where they end
+        """
+        return list(self._matches(text))
+
+    def __len__(self):
+        return len(self.phrases)
@@ -0,0 +1,176 @@
+"""
+Lightweight in-process metrics exposed in the Prometheus text format.
+Recording a value is a dictionary lookup and a few additions, cheap enough to leave on in production.
+"""
+
+import time
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond Mongo reads to long completions
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """
+        Args:
+            callback (callable): Read the value at scrape time instead of storing it, for
+                counters kept elsewhere. Returns a number, or a dict of label value tuples
+                to numbers for labelled counters
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        values = self._values
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.warning(f"Failed to collect {self.name}: {str(e)}")
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the block in seconds, including when it raises.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Create a singleton registry and the metrics shared across modules
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "chat_http_request_duration_seconds", "Time to response headers per route", ("method", "route", "status")
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge("chat_http_requests_in_flight", "HTTP requests being processed")
+HTTP_REQUESTS_IN_FLIGHT.set(0)
+MONGO_SECONDS = registry.histogram("chat_mongo_operation_seconds", "MongoDB round trip latency", ("operation",))
+CONTENT_FILTER_SECONDS = registry.histogram("chat_content_filter_seconds", "Local content filter latency")
+OUTPUT_SCREEN_SECONDS = registry.histogram("chat_output_screen_seconds", "Local output screening latency")
+GUARDRAILS_SECONDS = registry.histogram("chat_guardrails_seconds", "NeMo Guardrails invocation latency", ("stage",))
+LLM_SECONDS = registry.histogram("chat_llm_completion_seconds", "Upstream completion latency", ("kind",))
+LLM_PROMPT_TOKENS = registry.histogram("chat_llm_prompt_tokens", "Prompt tokens per completion", buckets=TOKEN_BUCKETS)
+LLM_COMPLETION_TOKENS = registry.histogram("chat_llm_completion_tokens", "Completion tokens per completion", buckets=TOKEN_BUCKETS)
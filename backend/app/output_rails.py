@@ -0,0 +1,90 @@
+"""
+Local output screening stage.
+Evaluates the deterministic keyword rules of the output rails in-process with the same
+matcher as the content filter. Responses it decides for certain, blocked jokes and canned
+replies, skip the LLM-backed NeMo Guardrails output rails; every other response is escalated
+to them for the safety and hallucination checks.
+"""
+
+import os
+import json
+import logging
+
+try:
+    from .content_filter import content_filter, load_pattern_set, load_colang_utterances, FILTERS_DIR
+    from .matcher import PhraseMatcher, tokenize
+except ImportError:
+    from app.content_filter import content_filter, load_pattern_set, load_colang_utterances, FILTERS_DIR
+    from app.matcher import PhraseMatcher, tokenize
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RAILS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guardrails", "config", "rails.co")
+
+# Decisions of the local stage. PASS is only given to canned replies known to be safe
+PASS = "pass"
+BLOCK = "block"
+ESCALATE = "escalate"
+
+def _normalize(text):
+    return " ".join(tokenize(text))
+
+class OutputScreen:
+    def __init__(self, joke_path=None):
+        joke_path = joke_path or os.path.join(FILTERS_DIR, "output_joke.json")
+        with open(joke_path, encoding="utf-8") as f:
+            self.replacement = json.load(f)["replacement"]
+
+        # Same rule as the "check output for jokes" rail
+        self.joke_matcher = PhraseMatcher(load_pattern_set(joke_path))
+
+        # Canned responses are known to be safe even though they mention jokes
+        known_responses = content_filter.joke_responses + load_colang_utterances(RAILS_PATH, "bot refuse joke content")
+        known_responses.append(self.replacement)
+        self.known_responses = {_normalize(response) for response in known_responses}
+
+        self.stats = {
+            "evaluated": 0,
+            "canned": 0,
+            "blocked": 0,
+            "escalated": 0,
+        }
+
+    def evaluate(self, response):
+        """
+        Decide on a bot response locally where the outcome is certain.
+
+        Args:
+            response (str): The bot response
+
+        Returns:
+            tuple: (decision, response) where decision is PASS, BLOCK or ESCALATE and
+                   response is the text to use, the replacement message when blocked
+        """
+        self.stats["evaluated"] += 1
+
+        if _normalize(response) in self.known_responses:
+            self.stats["canned"] += 1
+            return PASS, response
+
+        phrase = self.joke_matcher.search(response)
+        if phrase is not None:
+            logger.debug(f"Output stage blocked a response matching '{phrase}'")
+            self.stats["blocked"] += 1
+            return BLOCK, self.replacement
+
+        # The safety and hallucination checks can't be decided by keywords
+        self.stats["escalated"] += 1
+        return ESCALATE, response
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Decision counters and the number of LLM-backed output checks avoided
+        """
+        return {**self.stats, "escalations_avoided": self.stats["canned"] + self.stats["blocked"]}
+
+# Create a singleton instance
+output_screen = OutputScreen()
@@ -0,0 +1,212 @@
+"""
+Two-tier cache for bot answers to recurring questions.
+An in-process LRU with TTL sits in front of a MongoDB collection shared across workers.
+"""
+
+import hashlib
+import os
+import re
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _read_message(msg):
+    if isinstance(msg, dict):
+        return msg.get("sender", "unknown"), msg.get("content", "") or ""
+    return getattr(msg, "sender", "unknown"), getattr(msg, "content", "") or ""
+
+class ResponseCache:
+    def __init__(self, max_entries, ttl, local_ttl, enabled=True):
+        """
+        Args:
+            max_entries (int): Maximum number of entries kept in process
+            ttl (float): Lifetime of an entry in seconds in the shared tier
+            local_ttl (float): Lifetime of an entry in seconds in process. Invalidations only
+                reach other workers through the shared tier, so this bounds how long they
+                can keep serving a corrected answer
+            enabled (bool): When False every lookup is a miss and nothing is stored
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.local_ttl = min(local_ttl, ttl)
+        self.enabled = enabled
+        self.collection = None
+        # key -> (expires_at, question, response), least recently used first
+        self._entries = OrderedDict()
+        self.stats = {
+            "hits": 0,
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def bind(self, collection):
+        """
+        Attach the MongoDB collection used as the shared second tier.
+
+        Args:
+            collection: The Motor collection
+        """
+        self.collection = collection
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize a question so trivial differences in case, punctuation and spacing share an entry.
+
+        Args:
+            text (str): The question
+
+        Returns:
+            str: The normalized question
+        """
+        text = re.sub(r"[^\w\s]", " ", text.lower())
+        return " ".join(text.split())
+
+    def make_key(self, messages, summary=None):
+        """
+        Build the cache key for answering the last message of a context window.
+
+        Args:
+            messages (list): The context window, ending with the user question
+            summary (str): The rolling summary of older turns
+
+        Returns:
+            tuple: (key, question) or (None, None) if the window doesn't end with a user message
+        """
+        if not messages:
+            return None, None
+        sender, content = _read_message(messages[-1])
+        if sender != "user":
+            return None, None
+
+        question = self.normalize(content)
+        context = hashlib.sha256()
+        context.update((summary or "").encode("utf-8"))
+        for msg in messages[:-1]:
+            msg_sender, msg_content = _read_message(msg)
+            context.update(f"\x00{msg_sender}\x01{msg_content}".encode("utf-8"))
+
+        key = hashlib.sha256(f"{question}\x00{context.hexdigest()}".encode("utf-8")).hexdigest()
+        return key, question
+
+    def _store_local(self, key, question, response, expires_at):
+        self._entries[key] = (expires_at, question, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get(self, key):
+        """
+        Look up a cached answer.
+
+        Args:
+            key (str): Key from make_key
+
+        Returns:
+            str: The cached answer, or None on a miss
+        """
+        if not self.enabled or key is None:
+            return None
+
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, _, response = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["local_hits"] += 1
+                return response
+            del self._entries[key]
+
+        if self.collection is not None:
+            try:
+                document = await self.collection.find_one(
+                    {"_id": key, "expires_at": {"$gt": datetime.utcnow()}}
+                )
+            except Exception as e:
+                logger.warning(f"Response cache lookup failed: {str(e)}")
+                document = None
+            if document:
+                # Promote to the local tier for the remaining lifetime of the shared entry
+                remaining = (document["expires_at"] - datetime.utcnow()).total_seconds()
+                expires_at = time.time() + min(remaining, self.local_ttl)
+                self._store_local(key, document["question"], document["response"], expires_at)
+                self.stats["hits"] += 1
+                self.stats["shared_hits"] += 1
+                return document["response"]
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key, question, response):
+        """
+        Store an answer in both tiers.
+
+        Args:
+            key (str): Key from make_key
+            question (str): Normalized question from make_key, used for invalidation
+            response (str): The answer to cache
+        """
+        if not self.enabled or key is None:
+            return
+
+        self._store_local(key, question, response, time.time() + self.local_ttl)
+        if self.collection is not None:
+            try:
+                await self.collection.update_one(
+                    {"_id": key},
+                    {"$set": {
+                        "question": question,
+                        "response": response,
+                        "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Response cache write failed: {str(e)}")
+
+    async def invalidate(self, question):
+        """
+        Drop every cached answer to a question, whatever context it was cached under.
+        Other workers' local copies expire within local_ttl.
+
+        Args:
+            question (str): The question, normalized or not
+        """
+        question = self.normalize(question)
+        stale = [key for key, (_, entry_question, _) in self._entries.items() if entry_question == question]
+        for key in stale:
+            del self._entries[key]
+
+        removed = len(stale)
+        if self.collection is not None:
+            try:
+                result = await self.collection.delete_many({"question": question})
+                removed = max(removed, result.deleted_count)
+            except Exception as e:
+                logger.warning(f"Response cache invalidation failed: {str(e)}")
+        self.stats["invalidations"] += removed
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Hit, miss, eviction and invalidation counters plus the local size
+        """
+        return {**self.stats, "size": len(self._entries), "max_entries": self.max_entries}
+
+# Create a singleton instance
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    local_ttl=float(os.getenv("RESPONSE_CACHE_LOCAL_TTL", "60")),
+    enabled=os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true",
+)
@@ -0,0 +1,179 @@
+"""
+Full-text search of messages for the admin dashboard.
+Matching uses the text indexes on message content and feedback, see MessageStore.search.
+This module turns a query into highlight terms, pages through hits by relevance and cuts
+highlighted snippets out of the matching messages.
+"""
+
+import base64
+import json
+import re
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Characters of context kept on each side of the first highlighted term
+SNIPPET_RADIUS = 80
+
+# Shortest word used as a search term
+MIN_TERM_LENGTH = 2
+
+# Suffixes removed from words by _stem, longest first. "ies", "ied" and "y" are replaced by
+# i, which the pattern lets match either letter
+SUFFIXES = (
+    "ations", "ation", "ments", "ment", "ness", "ings", "ing", "ies", "ied", "ers",
+    "er", "ed", "es", "ly", "ic", "s", "e", "y",
+)
+
+# Shortest stem left by _stem
+MIN_STEM_LENGTH = 3
+
+def search_terms(query):
+    """
+    Extract what to highlight from a text search query: quoted phrases and words, without
+    the negated ones the matches can't contain. Words are split like the text index splits
+    them, on everything but letters and digits, so "joke's" gives "joke", and the pieces
+    shorter than MIN_TERM_LENGTH are dropped.
+
+    Args:
+        query (str): The query, in MongoDB $text syntax
+
+    Returns:
+        list: The phrases and words, lowercased
+    """
+    terms = []
+    for negated, phrase in re.findall(r'(-?)"([^"]+)"', query):
+        if not negated:
+            terms.append(" ".join(phrase.lower().split()))
+    remainder = re.sub(r'-?"[^"]*"', " ", query)
+    for word in remainder.split():
+        if not word.startswith("-"):
+            terms.extend(re.findall(r"\w+", word.lower()))
+    return [term for term in dict.fromkeys(terms) if len(term) >= MIN_TERM_LENGTH]
+
+def _stem(term):
+    # Cheap stand-in for the text index's stemming: remove one inflectional suffix and a
+    # doubled final consonant, so "studies", "diabetic" and "running" give "studi", "diabet"
+    # and "run", which match "study", "diabetes" and "runs" at word starts
+    if " " in term:
+        return term
+    for suffix in SUFFIXES:
+        if term.endswith(suffix):
+            if len(term) - len(suffix) >= MIN_STEM_LENGTH:
+                term = term[:-len(suffix)] + ("i" if suffix in ("ies", "ied", "y") else "")
+            break
+    if len(term) > MIN_STEM_LENGTH and term[-1] == term[-2] and term[-1] not in "aeioulsz":
+        term = term[:-1]
+    return term
+
+def highlight_pattern(terms):
+    """
+    Build a case-insensitive regular expression matching the terms at word starts. Words are
+    stemmed and trailing word characters are included, so that other forms of a word such as
+    plurals are highlighted. The syntax is shared by Python and MongoDB's $regexMatch.
+
+    Returns:
+        str: The pattern, or None without terms
+    """
+    if not terms:
+        return None
+    stems = sorted({_stem(term) for term in terms}, key=len, reverse=True)
+    alternatives = []
+    for stem in stems:
+        alternative = re.escape(stem).replace("\\ ", "\\s+")
+        if " " not in stem and stem.endswith("i"):
+            alternative = alternative[:-1] + "[iy]"
+        alternatives.append(alternative)
+    return rf"\b(?:{'|'.join(alternatives)})\w*"
+
+def make_snippet(text, pattern, radius=SNIPPET_RADIUS):
+    """
+    Cut a snippet around the first match of pattern.
+
+    Args:
+        text (str): The message content or feedback
+        pattern (str): From highlight_pattern
+        radius (int): Characters of context on each side of the first match
+
+    Returns:
+        dict: `text` of the snippet and `highlights`, a list of [start, end] offsets of the
+              matches within it, or None if the text doesn't match
+    """
+    if not text or not pattern:
+        return None
+    regex = re.compile(pattern, re.IGNORECASE)
+    first = regex.search(text)
+    if first is None:
+        return None
+
+    start = max(first.start() - radius, 0)
+    end = min(first.end() + radius, len(text))
+    # Don't cut words in half
+    if start > 0:
+        space = text.find(" ", start, first.start())
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(" ", first.end(), end)
+        end = space if space != -1 else end
+
+    snippet = text[start:end]
+    highlights = [[match.start(), match.end()] for match in regex.finditer(snippet)]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    offset = len(prefix)
+    return {
+        "text": f"{prefix}{snippet}{suffix}",
+        "highlights": [[match_start + offset, match_end + offset] for match_start, match_end in highlights],
+    }
+
+def encode_cursor(hit):
+    """
+    Encode the sort key of a hit, its relevance score and message id, as an opaque cursor
+    """
+    key = json.dumps({"s": hit["score"], "i": hit["id"]})
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (score, message_id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(key["s"]), str(key["i"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def to_result(hit, pattern):
+    """
+    Shape a hit from MessageStore.search for the API, replacing the message text with a
+    highlighted snippet of the content, or of the feedback if only the feedback matches.
+
+    Returns:
+        dict: The search result
+    """
+    field = "content"
+    snippet = make_snippet(hit.get("content"), pattern)
+    if snippet is None and hit.get("feedback"):
+        field = "feedback"
+        snippet = make_snippet(hit["feedback"], pattern)
+    if snippet is None:
+        # Matched through stemming only, show the start of the message
+        content = hit.get("content") or ""
+        snippet = {"text": content[:2 * SNIPPET_RADIUS] + ("…" if len(content) > 2 * SNIPPET_RADIUS else ""), "highlights": []}
+    return {
+        "conversation_id": hit["conversation_id"],
+        "message_id": hit["id"],
+        "sender": hit.get("sender"),
+        "timestamp": hit.get("timestamp"),
+        "rating": hit.get("rating"),
+        "is_improved": hit.get("is_improved") or False,
+        "score": hit["score"],
+        "field": field,
+        "snippet": snippet,
+    }
@@ -0,0 +1,99 @@
+"""
+Fast serialization of conversations and messages.
+Messages are built and stored as plain dicts, and documents this API wrote are shaped into
+responses without validating them again through the Pydantic models. Responses are encoded
+with orjson when it is installed, falling back to the standard library encoder.
+"""
+
+import json
+import uuid
+import logging
+from datetime import datetime
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields of a message in API responses and the default for messages stored without them
+MESSAGE_FIELDS = (
+    ("sender", None),
+    ("content", ""),
+    ("timestamp", None),
+    ("id", None),
+    ("rating", None),
+    ("feedback", None),
+    ("is_improved", False),
+)
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def dumps(data):
+    """
+    Encode data as compact JSON. Datetimes become ISO 8601 strings and other unknown types
+    their string form.
+
+    Args:
+        data: Dicts, lists and scalars as read from MongoDB
+
+    Returns:
+        bytes: The UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def new_message(sender, content):
+    """
+    Build a message to store, with the same fields as the Message model.
+
+    Args:
+        sender (str): 'user' or 'bot'
+        content (str): The message text
+
+    Returns:
+        dict: The message with a new id and the current time
+    """
+    return {
+        "sender": sender,
+        "content": content,
+        "timestamp": datetime.now(),
+        "id": str(uuid.uuid4()),
+        "rating": None,
+        "feedback": None,
+        "is_improved": False,
+    }
+
+def message_response(message):
+    """
+    Shape a stored message like the Message model, dropping internal fields such as a
+    pending improvement or the content filter's `blocked` flag. Used for API responses and
+    export lines alike.
+    """
+    return {field: message.get(field, default) for field, default in MESSAGE_FIELDS}
+
+def conversation_response(conversation):
+    """
+    Shape a stored conversation like the Conversation model.
+    """
+    return {
+        "id": conversation["id"],
+        "messages": [message_response(message) for message in conversation.get("messages", [])],
+        "created_at": conversation.get("created_at"),
+        "is_negative": conversation.get("is_negative") or False,
+    }
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with dumps. Route results are still passed through jsonable_encoder
+    by FastAPI, return an instance directly to skip that for data that is already plain."""
+
+    def render(self, content):
+        return dumps(content)
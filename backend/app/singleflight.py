@@ -0,0 +1,129 @@
+"""
+Coalesce concurrent identical calls into one and keep the result for a while.
+Callers asking for a key that is already being computed wait for that computation instead of
+starting their own, so a burst of identical requests costs one upstream call.
+"""
+
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    def __init__(self, ttl, max_entries):
+        """
+        Args:
+            ttl (float): Lifetime of a result in seconds, 0 to only coalesce concurrent calls
+            max_entries (int): Maximum number of results kept
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> task running the call in progress
+        self._in_flight = {}
+        # key -> (expires_at, result), least recently used first
+        self._results = OrderedDict()
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+            "cached": 0,
+        }
+
+    def _lookup(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return False, None
+        expires_at, result = entry
+        if expires_at <= time.time():
+            del self._results[key]
+            return False, None
+        self._results.move_to_end(key)
+        return True, result
+
+    def _store(self, key, result):
+        if self.ttl <= 0:
+            return
+        self._results[key] = (time.time() + self.ttl, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def do(self, key, call, cache_if=None):
+        """
+        Return the result for a key, running call() only if no identical call is in
+        progress and no result is cached.
+
+        Args:
+            key (hashable): Identifies identical calls
+            call (callable): Returns an awaitable producing the result
+            cache_if (callable): Called with the result; it is only kept if this returns True.
+                Concurrent callers share the result either way
+
+        Returns:
+            The result of call()
+
+        Raises:
+            Exception: Whatever call() raised, for every caller waiting on it. Failures are not cached
+        """
+        self.stats["calls"] += 1
+        found, result = self._lookup(key)
+        if found:
+            self.stats["cached"] += 1
+            return result
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # The call runs in its own task, so no caller, the first one included, can
+            # cancel it for the others by disconnecting
+            task = asyncio.ensure_future(self._run(key, call, cache_if))
+            task.add_done_callback(self._retrieve)
+            self._in_flight[key] = task
+            self.stats["executions"] += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, key, call, cache_if):
+        try:
+            result = await call()
+            if cache_if is None or cache_if(result):
+                self._store(key, result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    @staticmethod
+    def _retrieve(task):
+        # Mark the exception as retrieved when every caller went away before it was raised
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self, prefix):
+        """
+        Drop cached results whose tuple key starts with prefix. Calls in progress are not affected.
+
+        Args:
+            prefix (tuple): Leading elements of the keys to drop
+        """
+        stale = [key for key in self._results if key[:len(prefix)] == prefix]
+        for key in stale:
+            del self._results[key]
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Call counters and the number of calls in progress and results cached
+        """
+        return {**self.stats, "in_flight": len(self._in_flight), "entries": len(self._results)}
+
+# Create a singleton instance for improved responses, which are expensive and requested
+# repeatedly for the same message by double clicks, retries and several reviewers
+improvement_flights = SingleFlight(
+    ttl=float(os.getenv("IMPROVE_CACHE_TTL", "600")),
+    max_entries=int(os.getenv("IMPROVE_CACHE_SIZE", "256")),
+)
@@ -0,0 +1,2 @@
+# This file marks the directory as a Python package
+# Run benchmarks from the backend directory, e.g. python -m benchmarks.bench_content_filter
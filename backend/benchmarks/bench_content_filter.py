@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the content filter matching engines.
+Compares the previous single alternation regex with the PhraseMatcher automaton
+at increasing blocklist sizes:
+
+    python -m benchmarks.bench_content_filter [--messages 2000] [--sizes 10 100 10000]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from app.matcher import PhraseMatcher
+
+WORDS = (
+    "what is the latest treatment for type diabetes blood pressure heart kidney pain dose "
+    "medication side effects doctor symptoms fever cough child adult sleep diet exercise "
+    "vaccine infection allergy test results cholesterol insulin weight loss therapy chronic"
+).split()
+
+def make_phrases(count, rng):
+    """Generate distinct synthetic phrases of one to four words"""
+    phrases = set()
+    while len(phrases) < count:
+        phrases.add(" ".join(f"{rng.choice(WORDS)}{rng.randint(0, 999)}" for _ in range(rng.randint(1, 4))))
+    return sorted(phrases)
+
+def make_messages(count, phrases, rng, hit_ratio=0.1):
+    """Generate realistic-length messages, a fraction of which contain a blocked phrase"""
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 40))]
+        if rng.random() < hit_ratio:
+            words.insert(rng.randint(0, len(words)), rng.choice(phrases))
+        messages.append(" ".join(words))
+    return messages
+
+def build_regex(phrases):
+    """The previous engine: one case-insensitive alternation with word boundaries"""
+    return re.compile("|".join(rf"\b{re.escape(phrase)}\b" for phrase in phrases), re.IGNORECASE)
+
+def time_engine(search, messages, repeat=3):
+    """Best per-message time in microseconds and the number of hits"""
+    best = float("inf")
+    hits = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = sum(1 for message in messages if search(message))
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e6, hits
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 10000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'patterns':>9} {'regex build ms':>15} {'regex us/msg':>13} {'matcher build ms':>17} {'matcher us/msg':>15} {'speedup':>8}")
+    for size in args.sizes:
+        phrases = make_phrases(size, rng)
+        messages = make_messages(args.messages, phrases, rng)
+
+        start = time.perf_counter()
+        regex = build_regex(phrases)
+        regex_build = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        matcher = PhraseMatcher(phrases)
+        matcher_build = (time.perf_counter() - start) * 1000
+
+        regex_us, regex_hits = time_engine(lambda text: regex.search(text) is not None, messages)
+        matcher_us, matcher_hits = time_engine(lambda text: matcher.search(text) is not None, messages)
+        if regex_hits != matcher_hits:
+            print(f"warning: engines disagree at {size} patterns ({regex_hits} vs {matcher_hits} hits)")
+
+        print(f"{size:>9} {regex_build:>15.1f} {regex_us:>13.1f} {matcher_build:>17.1f} {matcher_us:>15.1f} {regex_us / matcher_us:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
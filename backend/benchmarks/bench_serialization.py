@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of the conversation response path.
+Compares building, validating and encoding a conversation through the Pydantic models and
+jsonable_encoder with the plain dict path of app.serialization, for conversations of
+increasing length:
+
+    python -m benchmarks.bench_serialization [--sizes 10 100 1000] [--repeat 20]
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from app.main import Conversation
+from app import serialization
+from app.serialization import conversation_response, dumps
+
+WORDS = (
+    "what is the latest treatment for type diabetes blood pressure heart kidney pain dose "
+    "medication side effects doctor symptoms fever cough child adult sleep diet exercise "
+    "vaccine infection allergy test results cholesterol insulin weight loss therapy chronic"
+).split()
+
+def make_conversation(count, rng):
+    """A stored conversation document with alternating user and bot messages, some rated"""
+    started = datetime(2024, 3, 18, 9, 0, 0)
+    messages = []
+    for i in range(count):
+        sender = "user" if i % 2 else "bot"
+        rating = rng.choice(["up", "down"]) if sender == "bot" and rng.random() < 0.2 else None
+        messages.append({
+            "sender": sender,
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 120 if sender == "bot" else 30))),
+            # MongoDB keeps millisecond precision
+            "timestamp": started + timedelta(seconds=i * 7, milliseconds=rng.randint(0, 999)),
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "rating": rating,
+            "feedback": "Not specific enough" if rating == "down" else None,
+            "is_improved": False,
+        })
+    return {"id": str(uuid.UUID(int=rng.getrandbits(128))), "messages": messages, "created_at": started, "is_negative": False}
+
+def pydantic_path(conversation):
+    """The previous path: response_model validation, jsonable_encoder, then the default encoder"""
+    content = jsonable_encoder(Conversation(**conversation))
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def fast_path(conversation):
+    return dumps(conversation_response(conversation))
+
+def time_path(path, conversation, repeat):
+    """Best time in milliseconds and the encoded body"""
+    best = float("inf")
+    body = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = path(conversation)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"{'messages':>9} {'KiB':>7} {'pydantic ms':>12} {f'fast ({encoder}) ms':>17} {'speedup':>8}")
+    for size in args.sizes:
+        conversation = make_conversation(size, rng)
+        before_ms, before = time_path(pydantic_path, conversation, args.repeat)
+        after_ms, after = time_path(fast_path, conversation, args.repeat)
+        if json.loads(before) != json.loads(after):
+            print(f"warning: paths disagree at {size} messages")
+
+        print(f"{size:>9} {len(after) / 1024:>7.1f} {before_ms:>12.2f} {after_ms:>17.2f} {before_ms / after_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
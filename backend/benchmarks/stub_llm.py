@@ -0,0 +1,125 @@
+"""
+OpenAI-compatible stub completion server for benchmarks.
+Answers /v1/chat/completions, streaming or not, after a configurable time to first token
+and at a configurable token rate, without calling any model:
+
+    python -m benchmarks.stub_llm --port 9100 --first-token-latency 0.3 --tokens-per-second 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "Type 2 diabetes is usually managed with lifestyle changes, metformin and, when needed, "
+    "GLP-1 receptor agonists or SGLT2 inhibitors. Please talk to your healthcare provider "
+    "about the treatment plan that fits your situation."
+).split()
+
+def create_app(first_token_latency, tokens_per_second, completion_tokens):
+    """
+    Build the stub server.
+
+    Args:
+        first_token_latency (float): Seconds before the first token
+        tokens_per_second (float): Rate of the following tokens
+        completion_tokens (int): Tokens per completion, capped by the request's max_tokens
+    """
+    app = FastAPI(title="Stub LLM")
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def completion_id():
+        return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        tokens = min(completion_tokens, int(body.get("max_tokens") or completion_tokens))
+        words = [WORDS[i % len(WORDS)] for i in range(tokens)]
+        prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4 + 1
+        model = body.get("model", "stub")
+        created = int(time.time())
+
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(first_token_latency + max(tokens - 1, 0) / tokens_per_second)
+            finally:
+                stats["in_flight"] -= 1
+            return JSONResponse({
+                "id": completion_id(),
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": tokens,
+                    "total_tokens": prompt_tokens + tokens
+                }
+            })
+
+        async def stream():
+            chunk_id = completion_id()
+            try:
+                await asyncio.sleep(first_token_latency)
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(1 / tokens_per_second)
+                    chunk = {
+                        "id": chunk_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": (" " if i else "") + word}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    app = create_app(args.first_token_latency, args.tokens_per_second, args.completion_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+def test_bucket_starts_full():
+    bucket = TokenBucket(rate=1, burst=3, now=0)
+    for _ in range(3):
+        assert bucket.wait_time(0) == 0
+        bucket.take(0)
+    assert bucket.wait_time(0) == pytest.approx(1.0)
+
+def test_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=2, burst=2, now=0)
+    bucket.take(0)
+    bucket.take(0)
+    assert bucket.wait_time(0.25) == pytest.approx(0.25)
+    assert bucket.wait_time(0.5) == 0
+    assert bucket.wait_time(100) == 0
+    assert bucket.tokens == 2
+
+def controller(**overrides):
+    settings = dict(global_rate=0, global_burst=0, conversation_rate=0, conversation_burst=0, max_in_flight=0)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+def test_conversation_rate_rejects_with_retry_after():
+    admission = controller(conversation_rate=1, conversation_burst=1)
+
+    async def run():
+        async with admission.admit("a"):
+            pass
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with admission.admit("a"):
+                pass
+        # Other conversations have their own bucket
+        async with admission.admit("b"):
+            pass
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "conversation_rate"
+    assert 0 < rejected.retry_after <= 1
+    assert admission.stats["admitted"] == 2
+
+def test_max_in_flight_rejects():
+    admission = controller(max_in_flight=1)
+
+    async def run():
+        async with admission.admit("a"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with admission.admit("b"):
+                    pass
+        return rejected.value
+
+    assert asyncio.run(run()).reason == "in_flight"
+    assert admission.in_flight == 0
+
+def test_turns_of_a_conversation_run_one_at_a_time():
+    admission = controller(max_waiting_per_conversation=1)
+    order = []
+
+    async def turn(name):
+        async with admission.admit("a"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    async def run():
+        first = asyncio.ensure_future(turn("first"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(turn("second"))
+        await asyncio.sleep(0)
+        # One turn runs and one waits, a third is rejected
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with admission.admit("a"):
+                pass
+        await asyncio.gather(first, second)
+        return rejected.value
+
+    assert asyncio.run(run()).reason == "conversation_busy"
+    assert order == ["first start", "first end", "second start", "second end"]
+    assert admission.get_stats()["conversations_busy"] == 0
@@ -0,0 +1,52 @@
+from app.context_window import ContextWindow, estimate_tokens
+
+def message(sender, content):
+    return {"sender": sender, "content": content}
+
+def conversation(count, length=40):
+    return [message("user" if i % 2 == 0 else "bot", f"Message {i}. " + "x" * length) for i in range(count)]
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcdefgh") == 3
+
+def test_everything_fits_in_budget():
+    window = ContextWindow(max_tokens=1000, summary_max_tokens=100)
+    messages = conversation(4)
+    recent, summary, changed = window.select(messages)
+    assert recent == messages
+    assert summary == {"text": "", "upto": 0}
+    assert not changed
+
+def test_overflow_folds_older_messages_into_summary():
+    window = ContextWindow(max_tokens=60, summary_max_tokens=1000)
+    messages = conversation(10)
+    recent, summary, changed = window.select(messages)
+    assert changed
+    assert recent == messages[summary["upto"]:]
+    assert summary["upto"] > 0
+    assert summary["text"].splitlines()[0] == "User: Message 0."
+    assert sum(estimate_tokens(f"{m['sender']}: {m['content']}") for m in recent) <= 60 * 0.75
+
+def test_minimum_recent_messages_kept_over_budget():
+    window = ContextWindow(max_tokens=1, summary_max_tokens=1000, min_recent_messages=2)
+    messages = conversation(5)
+    recent, summary, changed = window.select(messages)
+    assert recent == messages[-2:]
+    assert summary["upto"] == 3
+    assert changed
+
+def test_stored_summary_is_extended_not_rebuilt():
+    window = ContextWindow(max_tokens=1000, summary_max_tokens=1000)
+    messages = conversation(6)
+    stored = {"text": "User: Earlier.", "upto": 4}
+    recent, summary, changed = window.select(messages, stored)
+    assert recent == messages[4:]
+    assert summary is stored
+    assert not changed
+
+def test_summary_trimmed_to_its_budget():
+    window = ContextWindow(max_tokens=1, summary_max_tokens=10, min_recent_messages=1)
+    recent, summary, changed = window.select(conversation(20))
+    assert estimate_tokens(summary["text"]) <= 10 or len(summary["text"].splitlines()) == 1
+    assert summary["text"].splitlines()[-1].startswith("User: Message 18.")
@@ -0,0 +1,45 @@
+from app.matcher import PhraseMatcher, tokenize
+
+def test_tokenize_lowercases_and_splits_on_punctuation():
+    assert tokenize("Stand-up, COMEDY!") == ["stand", "up", "comedy"]
+
+def test_tokenize_drops_possessives_and_apostrophes():
+    assert tokenize("The joke's on you, don't laugh") == ["the", "joke", "on", "you", "dont", "laugh"]
+    assert tokenize("James’s pun") == ["james", "pun"]
+
+def test_tokenize_drops_lone_apostrophes():
+    assert tokenize("' 's ''") == []
+
+def test_search_matches_whole_words_only():
+    matcher = PhraseMatcher(["pun"])
+    assert matcher.search("that was a pun") == "pun"
+    assert matcher.search("punctual arrival") is None
+
+def test_search_matches_possessive():
+    matcher = PhraseMatcher(["joke"])
+    assert matcher.search("what's the joke's point") == "joke"
+
+def test_multi_word_phrase_matches_across_punctuation():
+    matcher = PhraseMatcher(["stand up"])
+    assert matcher.search("I love stand-up") == "stand up"
+    assert matcher.search("standup") is None
+
+def test_failure_links_recover_partial_matches():
+    matcher = PhraseMatcher(["tell me a joke", "me a"])
+    assert matcher.find_all("tell tell me a joke") == ["me a", "tell me a joke"]
+
+def test_find_all_reports_overlapping_phrases():
+    matcher = PhraseMatcher(["tell me a joke", "joke", "a joke"])
+    assert matcher.find_all("tell me a joke") == ["tell me a joke", "a joke", "joke"]
+
+def test_add_after_build_requires_rebuild():
+    matcher = PhraseMatcher(["joke"])
+    matcher.add("funny")
+    matcher.build()
+    assert matcher.search("so funny") == "funny"
+    assert len(matcher) == 2
+
+def test_duplicate_and_empty_phrases_are_ignored():
+    matcher = PhraseMatcher(["joke", "Joke", "", "!!"])
+    assert len(matcher) == 1
+    assert matcher.find_all("joke") == ["joke"]
@@ -0,0 +1,77 @@
+import pytest
+
+from app.metrics import MetricsRegistry
+
+def test_counter_with_labels():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    requests.inc(route="/a")
+    requests.inc(2, route='/b"c')
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a"} 1\n'
+        'requests_total{route="/b\\"c"} 2\n'
+    )
+
+def test_labels_must_match():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    with pytest.raises(ValueError):
+        requests.inc(status="200")
+
+def test_names_are_unique():
+    registry = MetricsRegistry()
+    registry.gauge("in_flight", "In flight")
+    with pytest.raises(ValueError):
+        registry.counter("in_flight", "In flight")
+
+def test_gauge_set_and_dec():
+    registry = MetricsRegistry()
+    in_flight = registry.gauge("in_flight", "In flight")
+    in_flight.set(3)
+    in_flight.dec()
+    assert registry.render().splitlines()[-1] == "in_flight 2"
+
+def test_callback_read_at_scrape_time():
+    registry = MetricsRegistry()
+    values = {("hit",): 3, ("miss",): 1}
+    registry.counter("cache_total", "Cache lookups", ("result",), callback=lambda: values)
+    registry.gauge("size", "Size", callback=lambda: 7.5)
+    lines = registry.render().splitlines()
+    assert 'cache_total{result="hit"} 3' in lines
+    assert 'cache_total{result="miss"} 1' in lines
+    assert "size 7.5" in lines
+
+def test_failing_callback_renders_no_samples():
+    registry = MetricsRegistry()
+
+    def fail():
+        raise RuntimeError("down")
+
+    registry.gauge("size", "Size", callback=fail)
+    assert registry.render() == "# HELP size Size\n# TYPE size gauge\n"
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    latency.observe(0.05)
+    latency.observe(0.1)
+    latency.observe(0.5)
+    latency.observe(5)
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 5.65",
+        "latency_seconds_count 4",
+    ]
+
+def test_histogram_time_observes_on_error():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ("stage",))
+    with pytest.raises(RuntimeError):
+        with latency.time(stage="generate"):
+            raise RuntimeError
+    assert 'latency_seconds_count{stage="generate"} 1' in registry.render().splitlines()
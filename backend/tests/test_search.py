@@ -0,0 +1,69 @@
+import re
+
+import pytest
+
+from app.search import decode_cursor, encode_cursor, highlight_pattern, make_snippet, search_terms, _stem
+
+def test_search_terms_splits_like_the_text_index():
+    assert search_terms("joke's") == ["joke"]
+    assert search_terms("c++") == []
+    assert search_terms("Blood-Pressure") == ["blood", "pressure"]
+
+def test_search_terms_keeps_phrases_and_drops_negations():
+    assert search_terms('"Blood  Sugar" insulin -diet -"low carb"') == ["blood sugar", "insulin"]
+
+def test_search_terms_deduplicates():
+    assert search_terms("Insulin insulin") == ["insulin"]
+
+@pytest.mark.parametrize("term, stem", [
+    ("studies", "studi"),
+    ("study", "studi"),
+    ("diabetic", "diabet"),
+    ("diabetes", "diabet"),
+    ("running", "run"),
+    ("jokes", "jok"),
+    ("cat", "cat"),
+    ("goes", "goes"),
+    ("blood sugar", "blood sugar"),
+])
+def test_stem(term, stem):
+    assert _stem(term) == stem
+
+def matches(pattern, words):
+    return [word for word in words if re.fullmatch(pattern, word, re.IGNORECASE)]
+
+def test_pattern_matches_other_forms_of_a_word():
+    pattern = highlight_pattern(["studies"])
+    assert matches(pattern, ["study", "studied", "studying", "Studies", "student"]) == ["study", "studied", "studying", "Studies"]
+
+def test_pattern_matches_phrases_across_whitespace():
+    pattern = highlight_pattern(["blood sugar"])
+    assert re.search(pattern, "high blood\n sugar levels", re.IGNORECASE)
+
+def test_pattern_without_terms():
+    assert highlight_pattern([]) is None
+
+def test_snippet_highlights_matches():
+    pattern = highlight_pattern(["insulin"])
+    snippet = make_snippet("Take insulin before meals. Insulin needs vary.", pattern)
+    text = snippet["text"]
+    assert [text[start:end] for start, end in snippet["highlights"]] == ["insulin", "Insulin"]
+
+def test_snippet_cuts_at_word_boundaries():
+    text = " ".join(["word"] * 50) + " insulin " + " ".join(["word"] * 50)
+    snippet = make_snippet(text, highlight_pattern(["insulin"]), radius=20)
+    assert snippet["text"].startswith("…word")
+    assert snippet["text"].endswith("word…")
+    start, end = snippet["highlights"][0]
+    assert snippet["text"][start:end] == "insulin"
+
+def test_snippet_without_match():
+    assert make_snippet("nothing here", highlight_pattern(["insulin"])) is None
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"score": 1.5, "id": "message-1"})
+    assert decode_cursor(cursor) == (1.5, "message-1")
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight(ttl=0, max_entries=10)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", call) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert len(calls) == 1
+    stats = flights.get_stats()
+    assert stats["executions"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+    # Without a TTL nothing is kept
+    assert stats["entries"] == 0
+
+def test_results_cached_for_ttl_when_cache_if_allows():
+    flights = SingleFlight(ttl=60, max_entries=10)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        first = await flights.do("kept", call)
+        second = await flights.do("kept", call)
+        skipped = await flights.do("skipped", call, cache_if=lambda result: False)
+        again = await flights.do("skipped", call, cache_if=lambda result: False)
+        return first, second, skipped, again
+
+    assert asyncio.run(run()) == (1, 1, 2, 3)
+    assert flights.stats["cached"] == 1
+
+def test_failures_reach_every_caller_and_are_not_cached():
+    flights = SingleFlight(ttl=60, max_entries=10)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def run():
+        return await asyncio.gather(flights.do("key", call), flights.do("key", call), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.get_stats()["entries"] == 0
+
+    with pytest.raises(ValueError):
+        asyncio.run(flights.do("key", call))
+    assert len(calls) == 2
+
+def test_cancelling_the_first_caller_does_not_cancel_the_call():
+    flights = SingleFlight(ttl=0, max_entries=10)
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", call))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(run()) == ("result", True)
+
+def test_forget_drops_keys_with_prefix():
+    flights = SingleFlight(ttl=60, max_entries=10)
+
+    async def call():
+        return "result"
+
+    async def run():
+        for key in [("a", 1), ("a", 2), ("b", 1)]:
+            await flights.do(key, call)
+
+    asyncio.run(run())
+    flights.forget(("a",))
+    assert list(flights._results) == [("b", 1)]
+
+def test_least_recently_used_results_evicted():
+    flights = SingleFlight(ttl=60, max_entries=2)
+
+    async def call():
+        return "result"
+
+    async def run():
+        await flights.do("a", call)
+        await flights.do("b", call)
+        await flights.do("a", call)
+        await flights.do("c", call)
+
+    asyncio.run(run())
+    assert list(flights._results) == ["a", "c"]
@@ -6,6 +6,44 @@ import UserAvatar from './UserAvatar';
 import { FaThumbsUp, FaThumbsDown, FaCheck, FaDownload, FaRobot, FaSync } from 'react-icons/fa';
 import '../AdminDashboard.css';
 
+// Poll an improvement job until the background workers finish it
+const waitForImprovementJob = async (jobId) => {
+  while (true) {
+    const { data: job } = await axios.get(`/api/improvement-jobs/${jobId}`);
+    if (job.status === 'done') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Improvement job failed');
+    }
+    await new Promise(resolve => setTimeout(resolve, 1000));
+  }
+};
+
+// Load the feedback counters kept by the backend for the last week
+const fetchAnalytics = async (setAnalytics) => {
+  try {
+    const response = await axios.get('/api/analytics', { params: { granularity: 'day', buckets: 7 } });
+    setAnalytics(response.data);
+  } catch (err) {
+    // The dashboard works without the counters
+    console.error('Error fetching analytics:', err);
+  }
+};
+
+// Render a search snippet with its matched terms highlighted
+const renderSnippet = (snippet) => {
+  const parts = [];
+  let position = 0;
+  snippet.highlights.forEach(([start, end], i) => {
+    parts.push(snippet.text.slice(position, start));
+    parts.push(<mark key={i}>{snippet.text.slice(start, end)}</mark>);
+    position = end;
+  });
+  parts.push(snippet.text.slice(position));
+  return parts;
+};
+
 const AdminDashboard = () => {
   const [conversations, setConversations] = useState([]);
   const [selectedConversation, setSelectedConversation] = useState(null);
@@ -22,6 +60,13 @@ const AdminDashboard = () => {
   const [improvedResponse, setImprovedResponse] = useState('');
   const [originalResponse, setOriginalResponse] = useState('');
   const [generatingImprovedResponse, setGeneratingImprovedResponse] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [analytics, setAnalytics] = useState(null);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
+  const [searchCursor, setSearchCursor] = useState(null);
+  const [searching, setSearching] = useState(false);
 
   // Fetch all conversations when component mounts
   useEffect(() => {
@@ -29,10 +74,12 @@ const AdminDashboard = () => {
       try {
         setLoading(true);
         const response = await axios.get('/api/conversations');
-        setConversations(response.data);
+        setConversations(response.data.conversations);
+        setNextCursor(response.data.next_cursor);
         // Select the first conversation by default if available
-        if (response.data.length > 0) {
-          setSelectedConversation(response.data[0]);
+        if (response.data.conversations.length > 0) {
+          const firstConversation = await axios.get(`/api/conversations/${response.data.conversations[0].id}`);
+          setSelectedConversation(firstConversation.data);
         }
         setLoading(false);
       } catch (err) {
@@ -43,8 +90,50 @@ const AdminDashboard = () => {
     };
 
     fetchConversations();
+    fetchAnalytics(setAnalytics);
   }, []);
 
+  // Load the next page of conversation summaries
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await axios.get('/api/conversations', { params: { cursor: nextCursor } });
+      setConversations(prevConversations => [...prevConversations, ...response.data.conversations]);
+      setNextCursor(response.data.next_cursor);
+    } catch (err) {
+      console.error('Error fetching conversations:', err);
+      setError('Failed to load conversations. Please try again later.');
+    }
+    setLoadingMore(false);
+  };
+
+  // Search message content and feedback, appending to the results when paging
+  const runSearch = async (cursor) => {
+    if (!searchQuery.trim()) return;
+    try {
+      setSearching(true);
+      const response = await axios.get('/api/search', { params: { q: searchQuery, cursor } });
+      setSearchResults(prevResults => cursor ? [...prevResults, ...response.data.results] : response.data.results);
+      setSearchCursor(response.data.next_cursor);
+    } catch (err) {
+      console.error('Error searching conversations:', err);
+      setError('Failed to search conversations. Please try again later.');
+    }
+    setSearching(false);
+  };
+
+  const handleSearch = (event) => {
+    event.preventDefault();
+    runSearch(null);
+  };
+
+  const handleClearSearch = () => {
+    setSearchQuery('');
+    setSearchResults(null);
+    setSearchCursor(null);
+  };
+
   // Handle conversation selection
   const handleSelectConversation = async (conversationId) => {
     try {
@@ -63,19 +152,19 @@ const AdminDashboard = () => {
     return date.toLocaleString();
   };
 
-  // Get a preview of the first message
+  // Get a preview of the last message from the conversation summary
   const getConversationPreview = (conversation) => {
-    if (!conversation || !conversation.messages || conversation.messages.length === 0) {
+    if (!conversation || !conversation.last_message_preview) {
       return 'No messages';
     }
-    const firstMessage = conversation.messages[0];
-    return firstMessage.content.substring(0, 50) + (firstMessage.content.length > 50 ? '...' : '');
+    const preview = conversation.last_message_preview;
+    return preview.substring(0, 50) + (preview.length > 50 ? '...' : '');
   };
 
   // Get the total number of messages in a conversation
   const getMessageCount = (conversation) => {
-    if (!conversation || !conversation.messages) return 0;
-    return conversation.messages.length;
+    if (!conversation) return 0;
+    return conversation.message_count || 0;
   };
 
   // Handle rating submission
@@ -105,6 +194,7 @@ const AdminDashboard = () => {
           
           // Update the UI to show the message was rated
           updateMessageRating(effectiveMessageId, 'up', index);
+          fetchAnalytics(setAnalytics);
         } catch (apiError) {
           console.error('API Error:', apiError);
           // If the API call fails, just update the UI locally
@@ -142,21 +232,23 @@ const AdminDashboard = () => {
         
         // Update the UI to show the message was rated
         updateMessageRating(currentRatedMessage.id, 'down', currentRatedMessage.index);
+        fetchAnalytics(setAnalytics);
         
         // Close the feedback modal
         setShowFeedbackModal(false);
         
-        // Generate improved response
+        // Queue the generation of an improved response and wait for it
         setGeneratingImprovedResponse(true);
-        const improvedResponseResult = await axios.post('/api/messages/improve', {
+        const jobResult = await axios.post('/api/improvement-jobs', {
           conversationId: selectedConversation.id,
           messageId: currentRatedMessage.id,
           feedback: feedbackText
         });
+        const improvedResponseResult = await waitForImprovementJob(jobResult.data.jobId);
         
         // Store the improved response and show the improved response modal
-        setImprovedResponse(improvedResponseResult.data.improvedResponse);
-        setOriginalResponse(improvedResponseResult.data.originalResponse);
+        setImprovedResponse(improvedResponseResult.improvedResponse);
+        setOriginalResponse(improvedResponseResult.originalResponse);
         setShowImprovedResponseModal(true);
         setGeneratingImprovedResponse(false);
         
@@ -233,6 +325,7 @@ const AdminDashboard = () => {
       }
       
       setShowSuccessToast(true);
+      fetchAnalytics(setAnalytics);
       setShowImprovedResponseModal(false);
       setCurrentRatedMessage(null);
       setImprovedResponse('');
@@ -274,31 +367,19 @@ const AdminDashboard = () => {
     try {
       setDownloadLoading(true);
       
-      // Filter out negative conversations
-      const filteredConversations = conversations.filter(conv => !conv.is_negative);
-      
-      // Convert conversations to JSONL format (one JSON object per line)
-      const jsonlData = filteredConversations.map(conversation => JSON.stringify(conversation)).join('\n');
-      
-      // Create blob with the data
-      const blob = new Blob([jsonlData], { type: 'application/jsonl' });
-      const url = URL.createObjectURL(blob);
-      
-      // Create a link and trigger download
+      // The backend streams the export and excludes negative conversations by default
       const link = document.createElement('a');
-      link.href = url;
-      link.download = `chat-conversations-${new Date().toISOString().slice(0, 10)}.jsonl`;
+      link.href = '/api/export.jsonl';
       document.body.appendChild(link);
       link.click();
       
       // Clean up
       document.body.removeChild(link);
-      URL.revokeObjectURL(url);
       
       setDownloadLoading(false);
       
       // Show success message
-      setSuccessMessage(`${filteredConversations.length} conversations downloaded successfully!`);
+      setSuccessMessage('Conversation export started');
       setShowSuccessToast(true);
     } catch (err) {
       console.error('Error downloading conversations:', err);
@@ -340,10 +421,25 @@ const AdminDashboard = () => {
           className="download-btn"
         >
           <FaDownload className="me-2" />
-          {downloadLoading ? 'Downloading...' : `Download ${conversations.filter(c => !c.is_negative).length} Conversations`}
+          {downloadLoading ? 'Downloading...' : 'Download Conversations'}
         </Button>
       </div>
       
+      {/* Feedback counters */}
+      {analytics && (
+        <div className="d-flex flex-wrap gap-2 mb-4 analytics-summary">
+          <Badge bg="success">Rated helpful: {analytics.totals.rating_up}</Badge>
+          <Badge bg="danger">Rated unhelpful: {analytics.totals.rating_down}</Badge>
+          <Badge bg="info">Improved responses: {analytics.totals.improved}</Badge>
+          <Badge bg="secondary">Negative conversations: {analytics.totals.negative_conversations}</Badge>
+          <Badge bg="warning" text="dark">Blocked requests: {analytics.totals.content_filter_blocks}</Badge>
+          <Badge bg="light" text="dark">
+            Last 7 days: {analytics.buckets.reduce((sum, bucket) => sum + bucket.rating_up, 0)} helpful,{' '}
+            {analytics.buckets.reduce((sum, bucket) => sum + bucket.rating_down, 0)} unhelpful
+          </Badge>
+        </div>
+      )}
+      
       {/* Success Toast */}
       <Toast 
         className="position-fixed top-0 end-0 m-4 z-index-toast"
@@ -363,12 +459,60 @@ const AdminDashboard = () => {
       <Row>
         {/* Conversations List (Left Side) */}
         <Col md={4} className="mb-4">
+          <Form onSubmit={handleSearch} className="d-flex mb-3">
+            <Form.Control
+              type="search"
+              placeholder="Search messages and feedback"
+              value={searchQuery}
+              onChange={(e) => setSearchQuery(e.target.value)}
+            />
+            <Button type="submit" variant="primary" className="ms-2" disabled={searching || !searchQuery.trim()}>
+              Search
+            </Button>
+            {searchResults && (
+              <Button variant="outline-secondary" className="ms-2" onClick={handleClearSearch}>
+                Clear
+              </Button>
+            )}
+          </Form>
           <Card className="shadow-sm">
             <Card.Header className="bg-primary text-white">
-              <h5 className="mb-0">Conversations ({conversations.length})</h5>
+              <h5 className="mb-0">
+                {searchResults ? `Search results (${searchResults.length})` : `Conversations (${conversations.length})`}
+              </h5>
             </Card.Header>
             <ListGroup variant="flush" style={{ maxHeight: '70vh', overflowY: 'auto' }}>
-              {conversations.length === 0 ? (
+              {searchResults ? (
+                <>
+                  {searchResults.length === 0 && (
+                    <ListGroup.Item className="text-center py-4">No matching messages</ListGroup.Item>
+                  )}
+                  {searchResults.map((result) => (
+                    <ListGroup.Item
+                      key={`${result.conversation_id}-${result.message_id}`}
+                      action
+                      active={selectedConversation && selectedConversation.id === result.conversation_id}
+                      onClick={() => handleSelectConversation(result.conversation_id)}
+                    >
+                      <div className="d-flex align-items-center">
+                        <small className="text-muted me-2">{formatDate(result.timestamp)}</small>
+                        <Badge bg={result.sender === 'user' ? 'secondary' : 'info'} pill>{result.sender}</Badge>
+                        {result.field === 'feedback' && (
+                          <Badge bg="warning" text="dark" pill className="ms-2">Feedback</Badge>
+                        )}
+                      </div>
+                      <p className="mb-0 mt-1 search-snippet">{renderSnippet(result.snippet)}</p>
+                    </ListGroup.Item>
+                  ))}
+                  {searchCursor && (
+                    <ListGroup.Item className="text-center">
+                      <Button variant="outline-primary" size="sm" onClick={() => runSearch(searchCursor)} disabled={searching}>
+                        {searching ? 'Loading...' : 'More results'}
+                      </Button>
+                    </ListGroup.Item>
+                  )}
+                </>
+              ) : conversations.length === 0 ? (
                 <ListGroup.Item className="text-center py-4">No conversations found</ListGroup.Item>
               ) : (
                 conversations.map((conversation) => (
@@ -398,6 +542,13 @@ const AdminDashboard = () => {
                   </ListGroup.Item>
                 ))
               )}
+              {!searchResults && nextCursor && (
+                <ListGroup.Item className="text-center">
+                  <Button variant="outline-primary" size="sm" onClick={handleLoadMore} disabled={loadingMore}>
+                    {loadingMore ? 'Loading...' : 'Load more'}
+                  </Button>
+                </ListGroup.Item>
+              )}
             </ListGroup>
           </Card>
         </Col>
@@ -55,14 +55,81 @@ const ChatBox = () => {
     setIsLoading(true);
     
     try {
-      // Send message to API
-      const response = await axios.post('/api/messages', {
-        conversation_id: conversationId,
-        content: input
+      // Stream the bot response from the API as server-sent events
+      const response = await fetch('/api/messages/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          conversation_id: conversationId,
+          content: input
+        })
       });
       
-      // Add bot response to state
-      setMessages(prevMessages => [...prevMessages, response.data]);
+      if (response.status === 429) {
+        // Over capacity, nothing was stored: take the message back so it can be resent
+        setMessages(prevMessages => prevMessages.filter(message => message !== userMessage));
+        setInput(userMessage.content);
+        throw new Error(`Too many requests, retry after ${response.headers.get('Retry-After')}s`);
+      }
+      
+      if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
+      
+      const updateBotMessage = (update) => {
+        setMessages(prevMessages => {
+          const lastMessage = prevMessages[prevMessages.length - 1];
+          return [...prevMessages.slice(0, -1), update(lastMessage)];
+        });
+      };
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let firstToken = true;
+      
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        for (const rawEvent of events) {
+          const eventLine = rawEvent.split('\n').find(line => line.startsWith('event: '));
+          const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          
+          const event = eventLine.slice('event: '.length);
+          const data = JSON.parse(dataLine.slice('data: '.length));
+          
+          if (event === 'token') {
+            if (firstToken) {
+              // Replace the typing indicator with the bot message as soon as the first token arrives
+              setIsLoading(false);
+              setMessages(prevMessages => [...prevMessages, { sender: 'bot', content: data.content, timestamp: new Date().toISOString() }]);
+              firstToken = false;
+            } else {
+              updateBotMessage(message => ({ ...message, content: message.content + data.content }));
+            }
+          } else if (event === 'replace' && !firstToken) {
+            // Output screening rewrote the streamed response
+            updateBotMessage(message => ({ ...message, content: data.content }));
+          } else if (event === 'done') {
+            // Replace the streamed message with the stored bot message
+            if (firstToken) {
+              setMessages(prevMessages => [...prevMessages, data]);
+              firstToken = false;
+            } else {
+              updateBotMessage(() => data);
+            }
+          }
+        }
+      }
+      
       setIsLoading(false);
     } catch (error) {
       console.error('Error sending message:', error);